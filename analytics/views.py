@@ -11,9 +11,11 @@ from django.http import HttpResponse
 from django.shortcuts import render
 from cart.models import OrderItem
 from shop.models import Good
+from shop.services.stock import fold_stock
 from .models import UserOrders, GoodIncome, DangerousGoods, OrderReport
 from users.decorators import role_required
 from chartjs.views.base import JSONView
+from shopBoom.responses import negotiated_response
 from django.db import connection
 
 
@@ -26,6 +28,8 @@ MATERIALIZED_VIEWS = [
 
 
 def refresh_materialized_views():
+    #dangerous_goods reads shop_good.amount, so bring sharded stock back into it first
+    fold_stock()
     with connection.cursor() as cursor:
         for view in MATERIALIZED_VIEWS:
             cursor.execute(f"REFRESH MATERIALIZED VIEW {view};")
@@ -137,7 +141,7 @@ def analytics_reports(request):
 
 
 def _goods_summary():
-    return list(
+    return (
         Good.objects.values("type__name")
         .annotate(total=Sum("amount"))
         .order_by("-total")
@@ -145,7 +149,7 @@ def _goods_summary():
 
 
 def _orders_summary():
-    return list(
+    return (
         OrderItem.objects.values("order__date")
         .annotate(
             revenue=Sum(
@@ -157,13 +161,31 @@ def _orders_summary():
     )
 
 
-class GoodsChartData(JSONView):
+class ChartDataView(JSONView):
+    #Subclasses provide summary() (a values() queryset) and chart(rows)
+    def get_context_data(self, **kwargs):
+        return self.chart(list(self.summary()))
+
+    #chartjs encodes with stdlib json; go through the project encoder instead
+    def render_to_response(self, context, **response_kwargs):
+        return negotiated_response(self.request, context, **response_kwargs)
+
+
+class AsyncChartDataMixin:
+    #Put ahead of a ChartDataView for the ASGI URLconf
+    async def get(self, request, *args, **kwargs):
+        rows = [row async for row in self.summary()]
+        return negotiated_response(request, self.chart(rows))
+
+
+class GoodsChartData(ChartDataView):
+    def summary(self):
+        return _goods_summary()
+
     def get_labels(self):
-        summary = _goods_summary()
-        return [entry["type__name"] or "Uncategorized" for entry in summary]
+        return [entry["type__name"] or "Uncategorized" for entry in _goods_summary()]
 
-    def get_context_data(self, **kwargs):
-        summary = _goods_summary()
+    def chart(self, summary):
         labels = [entry["type__name"] or "Uncategorized" for entry in summary]
         data = [entry["total"] or 0 for entry in summary]
         colors = ["#00296b", "#00509d", "#fdc500", "#fdda5c", "#0b1b2b"]
@@ -178,9 +200,11 @@ class GoodsChartData(JSONView):
         }
 
 
-class OrdersChartData(JSONView):
-    def get_context_data(self, **kwargs):
-        summary = _orders_summary()
+class OrdersChartData(ChartDataView):
+    def summary(self):
+        return _orders_summary()
+
+    def chart(self, summary):
         labels = [entry["order__date"].strftime("%Y-%m-%d") for entry in summary]
         data = [entry["revenue"] or 0 for entry in summary]
         return {
@@ -195,6 +219,14 @@ class OrdersChartData(JSONView):
         }
 
 
+class AsyncGoodsChartData(AsyncChartDataMixin, GoodsChartData):
+    pass
+
+
+class AsyncOrdersChartData(AsyncChartDataMixin, OrdersChartData):
+    pass
+
+
 @role_required("admin")
 def requirements_status(request):
     from users.models import Role
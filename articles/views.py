@@ -1,5 +1,6 @@
 from django.shortcuts import render, get_object_or_404
 from shop.models import Good
+from shop.services import catalog_cards
 from .models import Article
 
 
@@ -13,7 +14,7 @@ def article_list(request):
 
 def article_detail(request, pk):
     article = get_object_or_404(Article, id=pk)
-    related_goods = Good.objects.filter(article=article)
+    related_goods = catalog_cards(Good.objects.filter(article=article))
     context = {
         "Article": article,
         "Goods": related_goods,
@@ -4,3 +4,6 @@ from simple_history.admin import SimpleHistoryAdmin
 
 admin.site.register(Order, SimpleHistoryAdmin)
 admin.site.register(OrderItem, SimpleHistoryAdmin)
+admin.site.register(CartItem)
+admin.site.register(IdempotencyKey)
+admin.site.register(OutboxEmail)
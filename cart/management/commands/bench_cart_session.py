@@ -0,0 +1,66 @@
+import json
+import random
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from cart.services import Cart
+from cart.services.storage import encode_cart
+from shop.models import Good
+
+
+class Command(BaseCommand):
+    help = (
+        "Session payload size of the v1 and compact v2 cart layouts, and how many "
+        "cart operations of a scripted browsing session actually rewrite the session."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=1000)
+        parser.add_argument("--goods", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        self._sizes()
+        self._writes(options["operations"], options["goods"], random.Random(options["seed"]))
+
+    def _sizes(self):
+        store = SessionStore()
+        for lines in (1, 10, 50):
+            cart = {1000 + i: [1 + i % 3, 1999 + i * 50] for i in range(lines)}
+            v1 = {
+                str(good_id): {"amount": amount, "price_at_purchase": str(cents / 100)}
+                for good_id, (amount, cents) in cart.items()
+            }
+            v2 = encode_cart(cart)
+            #JSON is what the serializer produces; the stored value is that, compressed and signed
+            v1_json, v2_json = len(json.dumps(v1)), len(json.dumps(v2))
+            v1_size = len(store.encode({settings.CART_SESSION_ID: v1}))
+            v2_size = len(store.encode({settings.CART_SESSION_ID: v2}))
+            self.stdout.write(
+                f"{lines:3} lines: json v1 {v1_json:5,} / v2 {v2_json:5,} bytes ({v2_json / v1_json:.0%}), "
+                f"stored v1 {v1_size:5,} / v2 {v2_size:5,} bytes ({v2_size / v1_size:.0%})"
+            )
+
+    def _writes(self, operations, goods_count, rng):
+        #Unsaved goods: Cart.add/remove only read id, amount and cost
+        goods = [Good(id=i + 1, amount=rng.randint(0, 5), cost=rng.randint(100, 9999) / 100) for i in range(goods_count)]
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        writes = 0
+        for _ in range(operations):
+            cart = Cart(request)
+            good = rng.choice(goods)
+            action = rng.random()
+            if action < 0.4:
+                cart.add(good, 1)
+            elif action < 0.8:
+                cart.add(good, rng.randint(1, 5), override_quantity=True)
+            else:
+                cart.remove(good)
+            writes += request.session.modified
+            request.session.modified = False
+        #Before dirty tracking every add/remove call marked the session modified
+        self.stdout.write(f"{operations} cart operations: {operations} session writes before, {writes} now")
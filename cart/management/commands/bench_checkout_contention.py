@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pgtrigger
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from cart.models import Order
+from cart.services import CheckoutError, place_order
+from shop.models import Good
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Orders/sec on a single hot good with N parallel buyers, row-lock vs "
+        "lock-free stock reservation. Commits real rows and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--orders", type=int, default=400)
+        parser.add_argument("--stock", type=int, default=None, help="defaults to --orders (no sellout)")
+
+    def handle(self, *args, **options):
+        workers, orders = options["workers"], options["orders"]
+        stock = options["stock"] if options["stock"] is not None else orders
+        if connection.vendor == "sqlite":
+            self.stdout.write("SQLite has no row locks and one writer at a time; use PostgreSQL for real numbers")
+        stamp = int(time.time())
+        #bulk_create skips the user history signal; cost=0 keeps bonus balances untouched
+        buyers = User.objects.bulk_create(
+            [User(username=f"contention-{stamp}-{i}") for i in range(workers)]
+        )
+        try:
+            for label, lock_free in (("row lock", False), ("lock-free", True)):
+                good = Good.objects.create(name=f"contention-{stamp}-{label}", amount=stock, image="x.jpg")
+                elapsed, results = self._run(buyers, good.pk, orders, lock_free)
+                good.refresh_from_db()
+                self.stdout.write(
+                    f"{label:9} x{workers}: {results['placed'] / elapsed:,.0f} orders/s "
+                    f"({results['placed']} placed, {results['rejected']} out of stock, "
+                    f"{results['failed']} db errors, stock left {good.amount})"
+                )
+        finally:
+            #Order soft-deletes through a trigger on PostgreSQL; the rows must really go before their users
+            with pgtrigger.ignore("cart.Order:soft_dlete_order"):
+                Order.objects.filter(user__in=buyers).delete()
+            Good.objects.filter(name__startswith=f"contention-{stamp}-").delete()
+            User.objects.filter(pk__in=[buyer.pk for buyer in buyers]).delete()
+
+    @staticmethod
+    def _run(buyers, good_id, orders, lock_free):
+        def buy(index):
+            try:
+                place_order(buyers[index % len(buyers)], "bench", [(good_id, 1, None)], lock_free=lock_free)
+                return "placed"
+            except CheckoutError:
+                return "rejected"
+            except DatabaseError:
+                #Deadlocks / serialization failures / SQLite "database is locked"
+                return "failed"
+            finally:
+                close_old_connections()
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(buyers)) as pool:
+            results = list(pool.map(buy, range(orders)))
+        elapsed = time.perf_counter() - started
+        return elapsed, {outcome: results.count(outcome) for outcome in ("placed", "rejected", "failed")}
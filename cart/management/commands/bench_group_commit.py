@@ -0,0 +1,82 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pgtrigger
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from cart.models import Order
+from cart.services import CheckoutError, place_order
+from cart.services.batcher import CheckoutBatcher
+from shop.models import Good
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Checkout latency and throughput with N parallel buyers, one transaction per "
+        "order vs group commit. Commits real rows and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--orders", type=int, default=400)
+        parser.add_argument("--window-ms", type=float, default=5.0)
+        parser.add_argument("--max-batch", type=int, default=50)
+
+    def handle(self, *args, **options):
+        workers, orders = options["workers"], options["orders"]
+        if connection.vendor == "sqlite":
+            self.stdout.write("SQLite serializes writers and fsyncs cheaply; use PostgreSQL for real numbers")
+        stamp = int(time.time())
+        #bulk_create skips the user history signal; cost=0 keeps bonus balances untouched
+        buyers = User.objects.bulk_create(
+            [User(username=f"group-commit-{stamp}-{i}") for i in range(workers)]
+        )
+        batcher = CheckoutBatcher(window=options["window_ms"] / 1000, max_batch=options["max_batch"])
+        try:
+            for label, checkout in (
+                ("per order", place_order),
+                ("group", lambda *request: batcher.submit(*request).result()),
+            ):
+                good = Good.objects.create(name=f"group-commit-{stamp}-{label}", amount=orders, image="x.jpg")
+                elapsed, latencies, results = self._run(buyers, good.pk, orders, checkout)
+                good.refresh_from_db()
+                p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+                self.stdout.write(
+                    f"{label:9} x{workers}: {results['placed'] / elapsed:,.0f} orders/s, "
+                    f"p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms "
+                    f"({results['placed']} placed, {results['rejected']} out of stock, "
+                    f"{results['failed']} db errors, stock left {good.amount})"
+                )
+        finally:
+            #Order soft-deletes through a trigger on PostgreSQL; the rows must really go before their users
+            with pgtrigger.ignore("cart.Order:soft_dlete_order"):
+                Order.objects.filter(user__in=buyers).delete()
+            Good.objects.filter(name__startswith=f"group-commit-{stamp}-").delete()
+            User.objects.filter(pk__in=[buyer.pk for buyer in buyers]).delete()
+
+    @staticmethod
+    def _run(buyers, good_id, orders, checkout):
+        def buy(index):
+            started = time.perf_counter()
+            try:
+                checkout(buyers[index % len(buyers)], "bench", [(good_id, 1, None)])
+                outcome = "placed"
+            except CheckoutError:
+                outcome = "rejected"
+            except DatabaseError:
+                outcome = "failed"
+            finally:
+                close_old_connections()
+                connection.close()
+            return outcome, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(buyers)) as pool:
+            results = list(pool.map(buy, range(orders)))
+        elapsed = time.perf_counter() - started
+        outcomes = [outcome for outcome, _latency in results]
+        latencies = [latency for _outcome, latency in results]
+        return elapsed, latencies, {outcome: outcomes.count(outcome) for outcome in ("placed", "rejected", "failed")}
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from cart.services.idempotency import PURGE_BATCH_SIZE, purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete Idempotency-Key records older than IDEMPOTENCY_TTL. "
+        "Run it periodically (cron) so the table does not grow without bound."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        purged = purge_expired_keys(options["batch_size"])
+        self.stdout.write(f"Purged {purged} expired idempotency keys")
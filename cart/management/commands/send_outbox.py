@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from cart.services.outbox import deliver_batch, update_outbox_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued order emails from the outbox over one reusable mail connection. "
+        "Runs until interrupted; --once drains what is due and exits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "OUTBOX_BATCH_SIZE", 50))
+        parser.add_argument("--poll", type=float, default=getattr(settings, "OUTBOX_POLL_SECONDS", 2))
+        parser.add_argument("--once", action="store_true")
+
+    def handle(self, *args, **options):
+        delivered = depth = 0
+        with get_connection() as connection:
+            try:
+                while True:
+                    close_old_connections()
+                    attempted = deliver_batch(connection, options["batch_size"])
+                    delivered += attempted
+                    depth = update_outbox_metrics()
+                    if attempted:
+                        continue
+                    if options["once"]:
+                        break
+                    #Idle: let the SMTP server drop us rather than hold the socket open
+                    connection.close()
+                    time.sleep(options["poll"])
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f"Processed {delivered} outbox emails, {depth} still pending")
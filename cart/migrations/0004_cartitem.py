@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_idempotencykey'),
+        ('shop', '0005_stockslot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Amount')),
+                ('price_cents', models.PositiveIntegerField(verbose_name='Price in cents')),
+                ('good', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shop.good', verbose_name='Good')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Cart item',
+                'verbose_name_plural': 'Cart items',
+                'constraints': [models.UniqueConstraint(fields=('user', 'good'), name='cart_cartitem_user_good')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import datetime
 from simple_history.models import HistoricalRecords
 import pgtrigger
@@ -55,3 +56,80 @@ class OrderItem(models.Model):
         verbose_name = "OrderItem"
         verbose_name_plural= "OrderItem"
 
+
+class CartItem(models.Model):
+    #Cart line of a signed-in user when CART_BACKEND = "db", see cart.services.storage
+    user = models.ForeignKey("users.User", null=False, blank=False, verbose_name="User", on_delete=models.CASCADE, related_name="cart_items")
+    good = models.ForeignKey("shop.Good", null=False, blank=False, verbose_name="Good", on_delete=models.CASCADE)
+    amount = models.PositiveIntegerField(null=False, verbose_name="Amount")
+    price_cents = models.PositiveIntegerField(null=False, verbose_name="Price in cents")
+
+    def __str__(self):
+        return f"{self.user_id}: {self.good_id} x{self.amount}"
+
+    class Meta:
+        verbose_name = "Cart item"
+        verbose_name_plural = "Cart items"
+        constraints = [
+            #Also the index behind "lines of this user"
+            models.UniqueConstraint(fields=["user", "good"], name="cart_cartitem_user_good"),
+        ]
+
+class IdempotencyKey(models.Model):
+    #Stored outcome of a checkout retried with the same Idempotency-Key, see cart.services.idempotency
+    user = models.ForeignKey("users.User", null=False, blank=False, verbose_name="User", on_delete=models.CASCADE)
+    key = models.CharField(max_length=MAX_LENGTH, null=False, blank=False, verbose_name="Key")
+    fingerprint = models.CharField(max_length=64, null=False, blank=False, verbose_name="Request fingerprint")
+    status = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Status")
+    response = models.BinaryField(null=True, blank=True, verbose_name="Response")
+    created = models.DateTimeField(null=False, verbose_name="Created")
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} -> {self.status}"
+
+    class Meta:
+        verbose_name = "Idempotency key"
+        verbose_name_plural = "Idempotency keys"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="cart_idempotencykey_user_key"),
+        ]
+        indexes = [
+            models.Index(fields=["created"], name="cart_idempotency_created_idx"),
+        ]
+
+class OutboxEmail(models.Model):
+    #Mail written in the same transaction as the order, sent by manage.py send_outbox
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    subject = models.CharField(max_length=MAX_LENGTH, null=False, blank=False, verbose_name="Subject")
+    body = models.TextField(null=False, blank=True, verbose_name="Body")
+    from_email = models.CharField(max_length=MAX_LENGTH, null=False, blank=False, verbose_name="From")
+    recipients = models.JSONField(null=False, default=list, verbose_name="Recipients")
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING, verbose_name="Status")
+    attempts = models.PositiveSmallIntegerField(null=False, default=0, verbose_name="Attempts")
+    last_error = models.TextField(null=False, blank=True, default="", verbose_name="Last error")
+    created = models.DateTimeField(null=False, default=timezone.now, verbose_name="Created")
+    available_at = models.DateTimeField(null=False, default=timezone.now, verbose_name="Next attempt")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Sent")
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+    class Meta:
+        verbose_name = "Outbox email"
+        verbose_name_plural = "Outbox emails"
+        indexes = [
+            #The worker only ever scans the pending part of the table
+            models.Index(
+                fields=["available_at"],
+                condition=models.Q(status="pending"),
+                name="cart_outbox_pending_idx",
+            ),
+        ]
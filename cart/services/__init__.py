@@ -1,5 +1,26 @@
-from .cart import Cart
+from .batcher import checkout_batcher, submit_order
+from .cart import Cart, CartLine, CartSnapshot, serialize_cart
+from .checkout import CheckoutError, PlacedOrder, place_order, place_orders
+from .idempotency import IdempotencyError, idempotent_response, purge_expired_keys
+from .orders import aorder_history, order_history, serialize_order
+from .storage import merge_session_cart
 
 __all__ = [
-    "Cart"
-]
\ No newline at end of file
+    "Cart",
+    "CartLine",
+    "CartSnapshot",
+    "serialize_cart",
+    "CheckoutError",
+    "PlacedOrder",
+    "place_order",
+    "place_orders",
+    "checkout_batcher",
+    "submit_order",
+    "IdempotencyError",
+    "idempotent_response",
+    "purge_expired_keys",
+    "aorder_history",
+    "order_history",
+    "serialize_order",
+    "merge_session_cart",
+]
@@ -0,0 +1,102 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .checkout import place_order, place_orders
+
+logger = logging.getLogger(__name__)
+
+
+def group_commit_enabled():
+    return getattr(settings, "CHECKOUT_GROUP_COMMIT", False)
+
+
+class CheckoutBatcher:
+    """Collects concurrent checkouts for a few ms and commits them together.
+
+    One worker thread owns the batch transaction; callers block on a
+    Future carrying their own PlacedOrder or CheckoutError.
+    """
+
+    def __init__(self, window=0.005, max_batch=50):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, user, address, lines, bonus_request=Decimal("0.00")):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((future, (user, address, lines, bonus_request)))
+        return future
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="checkout-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            close_old_connections()
+            self.commit(batch)
+
+    def commit(self, batch):
+        requests = [request for _future, request in batch]
+        try:
+            outcomes = place_orders(requests)
+        except Exception:
+            #Only the batch transaction raises, and it rolled back: nothing was placed yet,
+            #so one bad apple (deadlock, lost race) must not fail the others: retry one by one
+            logger.exception("Group checkout of %s orders failed, placing them individually", len(batch))
+            outcomes = [self._place_one(request) for request in requests]
+        for (future, _request), outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    @staticmethod
+    def _place_one(request):
+        try:
+            return place_order(*request)
+        except Exception as exc:
+            return exc
+
+
+checkout_batcher = CheckoutBatcher(
+    window=getattr(settings, "CHECKOUT_BATCH_WINDOW_MS", 5) / 1000,
+    max_batch=getattr(settings, "CHECKOUT_BATCH_MAX", 50),
+)
+
+
+def submit_order(user, address, lines, bonus_request=Decimal("0.00")):
+    """place_order(), routed through the group-commit batcher when enabled.
+
+    Waits without a timeout: once queued the order may still commit, and
+    giving up would answer 500 for a placed order the client then retries.
+    """
+    if not group_commit_enabled():
+        return place_order(user, address, lines, bonus_request)
+    return checkout_batcher.submit(user, address, lines, bonus_request).result()
@@ -1,74 +1,138 @@
-from django.conf import settings
+from collections import namedtuple
 from decimal import Decimal
-from shop.models import Good
+
+from shop.services.stock import stock_amount
+
+from .storage import cart_store, cents
+
+# One priced cart row; a namedtuple is slotted and immutable
+CartLine = namedtuple("CartLine", ("good", "amount", "price_at_purchase", "total_price"))
+
+
+class CartSnapshot:
+    """Read-only, priced view of the cart, built once per request."""
+
+    __slots__ = ("lines", "total_price", "count")
+
+    def __init__(self, lines):
+        self.lines = tuple(lines)
+        self.total_price = sum((line.total_price for line in self.lines), Decimal("0"))
+        self.count = sum(line.amount for line in self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return self.count
+
+
+def serialize_cart(snapshot):
+    return {
+        "items": [
+            {
+                "good_id": line.good.id,
+                "name": line.good.name,
+                "amount": line.amount,
+                "price": float(line.price_at_purchase),
+                "total": float(line.total_price),
+            }
+            for line in snapshot
+        ],
+        "count": len(snapshot),
+        "total": float(snapshot.total_price),
+    }
+
 
 class Cart(object):
     def __init__(self, request):
-        #initializing cart
-        self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # save an empty cart in the session
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
-
-    def save(self):
-        self.session.modified = True
-    
-    def add(self, good, amount=1, override_quantity=False):
-        good_id = str(good.id)
-        if good_id not in self.cart:
-            self.cart[good_id] = {
-                'amount': 0,
-                'price_at_purchase': str(good.cost),
-            }
-        if good.amount <= 0:
-            if good_id in self.cart:
-                del self.cart[good_id]
-                self.save()
-            return
+        #initializing cart; an empty cart is not written anywhere
+        self.request = request
+        self.store = cart_store(request)
+        self.cart = self.store.load()
+
+    def _changed(self):
+        #The next snapshot() must see the change
+        self.request._cart_snapshot = None
+
+    def _build_snapshot(self, goods):
+        lines = []
+        for good_id, (amount, price_cents) in self.cart.items():
+            good = goods.get(good_id)
+            if good is None:
+                #Deleted from the catalog since it was added
+                continue
+            price = Decimal(price_cents).scaleb(-2)
+            lines.append(CartLine(good, amount, price, price * amount))
+        return CartSnapshot(lines)
+
+    def snapshot(self):
+        snapshot = getattr(self.request, "_cart_snapshot", None)
+        if snapshot is None:
+            snapshot = self.request._cart_snapshot = self._build_snapshot(self.store.goods(list(self.cart)))
+        return snapshot
+
+    def _line(self, good, amount, override_quantity):
+        #New [amount, price in cents] for good clamped to its stock, None when sold out
+        stock = stock_amount(good)
+        if stock <= 0:
+            return None
+        current = self.cart.get(good.id) or [0, cents(good.cost)]
         amount = int(amount)
-        if override_quantity:
-            amount = max(amount, 1)
-            amount = min(amount, good.amount)
-            self.cart[good_id]['amount'] = amount
-        else:
-            new_amount = self.cart[good_id]['amount'] + amount
-            new_amount = max(new_amount, 1)
-            new_amount = min(new_amount, good.amount)
-            self.cart[good_id]['amount'] = new_amount
-        self.save()
-    
-    def remove(self,good):
-        good_id = str(good.id)
-        
-        if good_id in self.cart:
-            del self.cart[good_id]
-        self.save()
-    
+        if not override_quantity:
+            amount += current[0]
+        return [min(max(amount, 1), stock), current[1]]
+
+    def add(self, good, amount=1, override_quantity=False):
+        line = self._line(good, amount, override_quantity)
+        if line is None:
+            self.remove(good)
+        elif line != self.cart.get(good.id):
+            #Only real changes are written, so untouched carts never rewrite the session row
+            self.cart[good.id] = line
+            self.store.save(self.cart, changed=[good.id])
+            self._changed()
+
+    def remove(self, good):
+        if good.id in self.cart:
+            del self.cart[good.id]
+            self.store.save(self.cart, removed=[good.id])
+            self._changed()
+
+    def update(self, changes):
+        """Set several lines from {good_id: amount}; an amount below 1 removes the line.
+
+        All goods are checked with one query and the store is written once.
+        Returns the unknown good ids, in which case nothing is changed.
+        """
+        goods = self.store.goods(list(set(self.cart) | set(changes)))
+        unknown = [good_id for good_id in changes if good_id not in goods]
+        if unknown:
+            return unknown
+        changed, removed = [], []
+        for good_id, amount in changes.items():
+            line = self._line(goods[good_id], amount, True) if amount > 0 else None
+            if line is None:
+                if self.cart.pop(good_id, None) is not None:
+                    removed.append(good_id)
+            elif line != self.cart.get(good_id):
+                self.cart[good_id] = line
+                changed.append(good_id)
+        if changed or removed:
+            self.store.save(self.cart, changed=changed, removed=removed)
+        #Every good in the cart was just loaded: the snapshot costs no query
+        self.request._cart_snapshot = self._build_snapshot(goods)
+        return []
+
     def __iter__(self):
-        #Loop throught cart items and fetch the products from the database
-        good_ids = self.cart.keys()
-        # get the product objects and add them to the cart
-        goods = Good.objects.filter(id__in=good_ids)
-        cart = self.cart.copy()
-        for good in goods:
-            cart[str(good.id)]['good'] = good
-        for item in cart.values():
-            item['price_at_purchase'] = Decimal(item['price_at_purchase'])
-            item['total_price'] = item['price_at_purchase'] * item['amount']
-            yield item 
-            
+        return iter(self.snapshot())
+
     def __len__(self):
-        return sum(item['amount'] for item in self.cart.values())
-    
+        return sum(amount for amount, _price in self.cart.values())
+
     def get_total_price(self):
-        return sum(
-            Decimal(item["price_at_purchase"]) * item["amount"]
-            for item in self.cart.values()
-        )
-    
+        return self.snapshot().total_price
+
     def clear(self):
-        #revove cart form session
-        del self.session[settings.CART_SESSION_ID]
-        self.save()
+        self.cart = {}
+        self.store.clear()
+        self._changed()
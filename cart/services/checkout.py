@@ -0,0 +1,214 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from cart.models import Order, OrderItem, OutboxEmail
+from shop.models import Good
+from shop.services.history import record_goods_history
+from shop.services.stock import decrement_stock, sharded_good_ids
+from users.models import User
+from .bonus import apply_bonus
+from .outbox import order_confirmation_email
+
+STOCK_ERROR = "Not enough stock for one or more items."
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class PlacedOrder:
+    def __init__(self, order, items, total, bonus_used, bonus_earned, total_after):
+        self.order = order
+        self.items = items
+        self.total = total
+        self.bonus_used = bonus_used
+        self.bonus_earned = bonus_earned
+        self.total_after = total_after
+
+
+def lock_free_stock():
+    return getattr(settings, "CHECKOUT_LOCK_FREE_STOCK", False)
+
+
+def _requested(lines):
+    requested = defaultdict(int)
+    for good_id, amount, _price in lines:
+        requested[good_id] += amount
+    return requested
+
+
+def _validate(lines, requested, goods, stock, unchecked=()):
+    #stock maps good_id -> available amount; goods in `unchecked` rely on the UPDATE
+    for good_id, amount, _price in lines:
+        good = goods.get(good_id)
+        if good is None:
+            raise CheckoutError(f"Product {good_id} not found", status=404)
+        if amount < 1 or (good_id not in unchecked and requested[good_id] > stock[good_id]):
+            raise CheckoutError(f"Invalid quantity for {good.name}")
+
+
+def _price(lines, goods):
+    priced = [
+        (goods[good_id], amount, Decimal(str(goods[good_id].cost if price is None else price)))
+        for good_id, amount, price in lines
+    ]
+    total = sum((price * amount for _good, amount, price in priced), Decimal("0.00"))
+    return priced, total
+
+
+def _order_items(order, user, priced):
+    return [
+        OrderItem(order=order, good=good, user=user, amount=amount, price_at_purchase=float(price))
+        for good, amount, price in priced
+    ]
+
+
+def place_order(user, address, lines, bonus_request=Decimal("0.00"), lock_free=None):
+    """Create an order from lines of (good_id, amount, price).
+
+    price=None charges the good's current cost. The statement count does
+    not depend on the number of lines: one insert for the items, one
+    conditional UPDATE for stock and one bulk insert for goods history.
+
+    In lock-free mode the goods rows are read without FOR UPDATE and the
+    conditional UPDATE is the only stock check, so concurrent buyers of
+    the same good only serialize for the duration of that statement.
+    Sharded goods (see shop.services.stock) are never locked and take
+    their stock from a random slot row.
+    """
+    if lock_free is None:
+        lock_free = lock_free_stock()
+    requested = _requested(lines)
+
+    with transaction.atomic():
+        locked_user = User.objects.select_for_update().get(pk=user.pk)
+        sharded = sharded_good_ids(list(requested))
+        unlocked = set(requested) if lock_free else sharded
+        goods = Good.objects.in_bulk(list(unlocked))
+        if len(unlocked) < len(requested):
+            goods.update(Good.objects.select_for_update().in_bulk([i for i in requested if i not in unlocked]))
+        _validate(lines, requested, goods, {good_id: good.amount for good_id, good in goods.items()}, unlocked)
+
+        priced, total = _price(lines, goods)
+        balance = locked_user.bonus or Decimal("0.00")
+        bonus_used, bonus_earned, total_after = apply_bonus(balance, total, bonus_request)
+
+        order = Order.objects.create(user=user, address=address)
+        items = bulk_create_with_history(_order_items(order, user, priced), OrderItem)
+        if not decrement_stock(requested, sharded):
+            #Raising rolls back the order and the items inserted above
+            raise CheckoutError(STOCK_ERROR, status=409)
+        #Sharded goods keep their Good row (and its history) untouched until folded
+        plain = [good_id for good_id in requested if good_id not in sharded]
+        if lock_free:
+            #Our snapshot may predate other checkouts; history wants the real amounts
+            changed = Good.objects.in_bulk(plain).values()
+        else:
+            changed = [goods[good_id] for good_id in plain]
+            for good in changed:
+                good.amount -= requested[good.pk]
+        record_goods_history(changed, "~", "checkout")
+
+        if bonus_used or bonus_earned:
+            locked_user.bonus = balance - bonus_used + bonus_earned
+            locked_user.save(update_fields=["bonus"])
+
+        placed = PlacedOrder(order, items, total, bonus_used, bonus_earned, total_after)
+        #Committed together with the order; manage.py send_outbox delivers it
+        email = order_confirmation_email(user, placed, address)
+        if email is not None:
+            email.save()
+    return placed
+
+
+def place_orders(requests):
+    """Commit several checkouts in one transaction (group commit).
+
+    requests are (user, address, lines, bonus_request) tuples. Returns one
+    outcome per request, a PlacedOrder or a CheckoutError, validated in
+    arrival order against the stock left by the requests before it.
+    Requests touching sharded goods are placed one by one afterwards; by
+    then the batch is committed, so their failures (of any kind) become
+    their outcome instead of propagating. An exception from this function
+    therefore means nothing was committed.
+    """
+    outcomes = [None] * len(requests)
+    good_ids = {good_id for _user, _address, lines, _bonus in requests for good_id, _amount, _price in lines}
+    sharded = sharded_good_ids(list(good_ids))
+    deferred = [
+        index for index, (_user, _address, lines, _bonus) in enumerate(requests)
+        if any(good_id in sharded for good_id, _amount, _price in lines)
+    ]
+
+    with transaction.atomic():
+        users = User.objects.select_for_update().in_bulk({user.pk for user, _a, _l, _b in requests})
+        goods = Good.objects.select_for_update().in_bulk(list(good_ids - sharded))
+        stock = {good_id: good.amount for good_id, good in goods.items()}
+        balances = {pk: user.bonus or Decimal("0.00") for pk, user in users.items()}
+        accepted, deltas = [], defaultdict(int)
+        for index, (user, address, lines, bonus_request) in enumerate(requests):
+            if index in deferred:
+                continue
+            requested = _requested(lines)
+            try:
+                _validate(lines, requested, goods, stock)
+            except CheckoutError as exc:
+                outcomes[index] = exc
+                continue
+            for good_id, amount in requested.items():
+                stock[good_id] -= amount
+                deltas[good_id] += amount
+            priced, total = _price(lines, goods)
+            bonus_used, bonus_earned, total_after = apply_bonus(balances[user.pk], total, bonus_request)
+            balances[user.pk] = balances[user.pk] - bonus_used + bonus_earned
+            accepted.append((index, user, address, priced, total, bonus_used, bonus_earned, total_after))
+
+        if accepted:
+            orders = bulk_create_with_history(
+                [Order(user=user, address=address) for _i, user, address, *_rest in accepted],
+                Order,
+            )
+            items = bulk_create_with_history(
+                [
+                    item
+                    for order, (_i, user, _a, priced, *_rest) in zip(orders, accepted)
+                    for item in _order_items(order, user, priced)
+                ],
+                OrderItem,
+            )
+            if not decrement_stock(deltas, set()):
+                raise CheckoutError(STOCK_ERROR, status=409)
+            for good_id, amount in stock.items():
+                goods[good_id].amount = amount
+            record_goods_history([goods[good_id] for good_id in deltas], "~", "checkout")
+            changed = []
+            for pk, balance in balances.items():
+                if balance != (users[pk].bonus or Decimal("0.00")):
+                    users[pk].bonus = balance
+                    changed.append(users[pk])
+            if changed:
+                bulk_update_with_history(changed, User, ["bonus"])
+
+            by_order = defaultdict(list)
+            for item in items:
+                by_order[item.order_id].append(item)
+            emails = []
+            for order, (index, user, address, _p, total, bonus_used, bonus_earned, total_after) in zip(orders, accepted):
+                outcomes[index] = PlacedOrder(order, by_order[order.pk], total, bonus_used, bonus_earned, total_after)
+                emails.append(order_confirmation_email(user, outcomes[index], address))
+            OutboxEmail.objects.bulk_create([email for email in emails if email is not None])
+
+    for index in deferred:
+        user, address, lines, bonus_request = requests[index]
+        try:
+            outcomes[index] = place_order(user, address, lines, bonus_request)
+        except Exception as exc:
+            outcomes[index] = exc
+    return outcomes
@@ -0,0 +1,118 @@
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from cart.models import IdempotencyKey
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+POLL_INTERVAL = 0.05
+PURGE_BATCH_SIZE = 1000
+
+
+class IdempotencyError(Exception):
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _wait_seconds():
+    return getattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 30)
+
+
+def _lease_seconds():
+    return getattr(settings, "IDEMPOTENCY_LEASE_SECONDS", 300)
+
+
+def _ttl_seconds():
+    return getattr(settings, "IDEMPOTENCY_TTL", 24 * 60 * 60)
+
+
+def _expired_before():
+    return timezone.now() - timedelta(seconds=_ttl_seconds())
+
+
+def purge_expired_keys(batch_size=PURGE_BATCH_SIZE):
+    #Deletes in pk batches so a large backlog never holds one long lock on the table
+    purged = 0
+    while True:
+        expired = list(
+            IdempotencyKey.objects.filter(created__lt=_expired_before()).values_list("pk", flat=True)[:batch_size]
+        )
+        if not expired:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=expired).delete()[0]
+
+
+def _claim(user, key, digest):
+    #The unique (user, key) index decides who runs the request; losers get the existing row
+    while True:
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(user=user, key=key, fingerprint=digest, created=timezone.now())
+            return None
+        except IntegrityError:
+            row = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if row is None:
+            #Released or purged between our INSERT and SELECT; try again
+            continue
+        #A key past its TTL is as good as purged; drop it and claim afresh
+        if not IdempotencyKey.objects.filter(pk=row.pk, created__lt=_expired_before()).delete()[0]:
+            return row
+
+
+def _take_over(row):
+    #A claim older than the lease belongs to a crashed worker, not a slow one
+    now = timezone.now()
+    stale = now - timedelta(seconds=_lease_seconds())
+    return IdempotencyKey.objects.filter(pk=row.pk, status__isnull=True, created__lt=stale).update(created=now) == 1
+
+
+def _replay(row):
+    response = HttpResponse(bytes(row.response), status=row.status, content_type="application/json")
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent_response(user, key, body, respond):
+    """Run respond() once per (user, key) and answer retries from storage.
+
+    Duplicates arriving while the first request is in flight wait for its
+    result; replays never touch Good or User rows. Server errors are not
+    stored, so the client may retry them with the same key.
+    """
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise IdempotencyError(f"Idempotency-Key is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters", status=400)
+    digest = hashlib.sha256(body).hexdigest()
+    deadline = time.monotonic() + _wait_seconds()
+    row = _claim(user, key, digest)
+    while row is not None:
+        if row.fingerprint != digest:
+            raise IdempotencyError("Idempotency-Key was already used with a different request", status=422)
+        if row.status is not None:
+            return _replay(row)
+        if _take_over(row):
+            break
+        if time.monotonic() >= deadline:
+            raise IdempotencyError("A request with this Idempotency-Key is still in progress")
+        time.sleep(POLL_INTERVAL)
+        #The first request may have failed and released its claim meanwhile
+        row = IdempotencyKey.objects.filter(pk=row.pk).first() or _claim(user, key, digest)
+
+    claim = IdempotencyKey.objects.filter(user=user, key=key)
+    try:
+        response = respond()
+    except BaseException:
+        claim.delete()
+        raise
+    if response.status_code >= 500:
+        claim.delete()
+    else:
+        claim.update(status=response.status_code, response=response.content)
+    return response
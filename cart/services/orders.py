@@ -0,0 +1,59 @@
+from django.db.models import F, FloatField, Prefetch, Sum
+from django.db.models.functions import Coalesce
+
+from cart.models import Order, OrderItem
+from shop.services.pagination import akeyset_paginate, keyset_paginate
+
+# Newest first; id breaks ties between orders placed on the same day
+ORDER_SORTS = {"-date": ("-date", "-id")}
+ORDER_SORT = "-date"
+
+
+def _orders(user, date_from=None, date_to=None):
+    #Fixed plan: one query for the page (with totals), one for all of its items
+    items = OrderItem.objects.select_related("good").only(
+        "order_id", "amount", "price_at_purchase", "good__name"
+    ).order_by("id")
+    orders = (
+        Order.objects.filter(user=user)
+        .only("id", "date")
+        .annotate(
+            total=Coalesce(
+                Sum(F("fk_order__amount") * F("fk_order__price_at_purchase"), output_field=FloatField()),
+                0.0,
+                output_field=FloatField(),
+            )
+        )
+        .prefetch_related(Prefetch("fk_order", queryset=items))
+    )
+    if date_from:
+        orders = orders.filter(date__gte=date_from)
+    if date_to:
+        orders = orders.filter(date__lte=date_to)
+    return orders
+
+
+def order_history(user, limit, after=None, before=None, date_from=None, date_to=None):
+    orders = _orders(user, date_from, date_to)
+    return keyset_paginate(orders, limit, sort=ORDER_SORT, after=after, before=before, sorts=ORDER_SORTS)
+
+
+async def aorder_history(user, limit, after=None, before=None, date_from=None, date_to=None):
+    orders = _orders(user, date_from, date_to)
+    return await akeyset_paginate(orders, limit, sort=ORDER_SORT, after=after, before=before, sorts=ORDER_SORTS)
+
+
+def serialize_order(order):
+    return {
+        "order_id": order.id,
+        "date": str(order.date),
+        "total": round(order.total, 2),
+        "items": [
+            {
+                "good": item.good.name,
+                "amount": item.amount,
+                "price": item.price_at_purchase,
+            }
+            for item in order.fk_order.all()
+        ],
+    }
@@ -0,0 +1,142 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from cart.models import OutboxEmail
+from users.metrics import (
+    outbox_failed_counter,
+    outbox_latency_histogram,
+    outbox_oldest_pending_gauge,
+    outbox_pending_gauge,
+    outbox_retry_counter,
+    outbox_sent_counter,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def outbox_email(subject, body, recipients, from_email=None):
+    #Unsaved row: save it inside the transaction that makes the mail true
+    return OutboxEmail(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def order_confirmation_email(user, placed, address):
+    if not user.email:
+        return None
+    order = placed.order
+    lines = [
+        f"Thank you for your purchase, {user.username}!",
+        f"Order #{order.id} summary:",
+        "",
+    ]
+    for item in placed.items:
+        lines.append(f"- {item.good.name} x{item.amount} - ${item.price_at_purchase * item.amount:.2f}")
+    lines.extend(
+        [
+            "",
+            f"Bonus used: ${placed.bonus_used:.2f}",
+            f"Bonus earned: ${placed.bonus_earned:.2f}",
+            f"Total charged: ${placed.total_after:.2f}",
+            f"Shipping address: {address}",
+            "",
+            "If you have questions, reply to this message.",
+        ]
+    )
+    return outbox_email(f"ShopBoom order #{order.id}", "\n".join(lines), [user.email])
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, "OUTBOX_RETRY_BASE_SECONDS", 30)
+    return min(base * 2 ** (attempts - 1), getattr(settings, "OUTBOX_RETRY_MAX_SECONDS", 3600))
+
+
+def _message(row, connection):
+    return EmailMessage(row.subject, row.body, row.from_email, row.recipients, connection=connection)
+
+
+def _send(rows, connection):
+    """Send rows over one open connection; returns {row.pk: error} for the failures.
+
+    One send_messages() call per row on the shared connection: a batch call
+    stops at the first bad recipient without saying which earlier ones went
+    out, and retrying those would mail them twice.
+    """
+    try:
+        connection.open()
+    except Exception as exc:
+        return {row.pk: f"{type(exc).__name__}: {exc}" for row in rows}
+    errors = {}
+    for row in rows:
+        try:
+            connection.send_messages([_message(row, connection)])
+        except Exception as exc:
+            errors[row.pk] = f"{type(exc).__name__}: {exc}"
+    if errors:
+        #The server may have dropped us; reconnect for the next batch
+        connection.close()
+    return errors
+
+
+def deliver_batch(connection, batch_size=None):
+    """Send up to batch_size due emails. Returns how many rows were attempted.
+
+    Rows are claimed with SKIP LOCKED, so several workers can drain the
+    same table. Failures are retried with exponential backoff until
+    OUTBOX_MAX_ATTEMPTS, then marked failed.
+    """
+    batch_size = batch_size or getattr(settings, "OUTBOX_BATCH_SIZE", 50)
+    max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+    with transaction.atomic():
+        rows = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING, available_at__lte=timezone.now())
+            .order_by("available_at")[:batch_size]
+        )
+        if not rows:
+            return 0
+        #The row locks are held while sending so no other worker sends the same mail
+        errors = _send(rows, connection)
+        now = timezone.now()
+
+        sent = [row for row in rows if row.pk not in errors]
+        if sent:
+            OutboxEmail.objects.filter(pk__in=[row.pk for row in sent]).update(
+                status=OutboxEmail.SENT, sent_at=now, attempts=F("attempts") + 1
+            )
+            outbox_sent_counter.inc(len(sent))
+            for row in sent:
+                outbox_latency_histogram.observe((now - row.created).total_seconds())
+
+        failed = [row for row in rows if row.pk in errors]
+        for row in failed:
+            row.attempts += 1
+            row.last_error = errors[row.pk]
+            if row.attempts >= max_attempts:
+                row.status = OutboxEmail.FAILED
+                outbox_failed_counter.inc()
+                logger.error("Giving up on outbox email %s after %s attempts: %s", row.pk, row.attempts, row.last_error)
+            else:
+                row.available_at = now + timedelta(seconds=_retry_delay(row.attempts))
+                outbox_retry_counter.inc()
+        if failed:
+            OutboxEmail.objects.bulk_update(failed, ["attempts", "last_error", "status", "available_at"])
+    return len(rows)
+
+
+def update_outbox_metrics():
+    pending = OutboxEmail.objects.filter(status=OutboxEmail.PENDING).aggregate(depth=Count("id"), oldest=Min("created"))
+    outbox_pending_gauge.set(pending["depth"])
+    oldest = pending["oldest"]
+    outbox_oldest_pending_gauge.set((timezone.now() - oldest).total_seconds() if oldest else 0)
+    return pending["depth"]
+
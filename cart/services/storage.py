@@ -0,0 +1,136 @@
+from contextlib import nullcontext
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from cart.models import CartItem
+from shop.models import Good
+
+# Bump when the session layout changes; decode_cart() keeps reading older ones
+CART_FORMAT_VERSION = 2
+
+
+def cents(price):
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+def decode_cart(stored):
+    """Session value -> {good_id: [amount, price in cents]}.
+
+    Reads the compact v2 layout and the v1 dict of dicts that older
+    sessions still carry; v1 carts are rewritten as v2 on their next change.
+    """
+    if not stored:
+        return {}
+    if stored.get("v") == CART_FORMAT_VERSION:
+        return {
+            good_id: [amount, price]
+            for good_id, amount, price in zip(stored["ids"], stored["qty"], stored["cents"])
+        }
+    return {
+        int(good_id): [item["amount"], cents(item["price_at_purchase"])]
+        for good_id, item in stored.items()
+    }
+
+
+def encode_cart(cart):
+    #Parallel arrays: no per-line keys, integer prices
+    return {
+        "v": CART_FORMAT_VERSION,
+        "ids": list(cart),
+        "qty": [amount for amount, _price in cart.values()],
+        "cents": [price for _amount, price in cart.values()],
+    }
+
+
+class SessionCartStore:
+    #The whole cart is one session value, rewritten on every change
+    def __init__(self, request):
+        self.session = request.session
+
+    def load(self):
+        return decode_cart(self.session.get(settings.CART_SESSION_ID))
+
+    def goods(self, good_ids):
+        return Good.objects.in_bulk(good_ids)
+
+    def save(self, cart, changed=(), removed=()):
+        #No database work here, so callers never need a transaction for it
+        self.session[settings.CART_SESSION_ID] = encode_cart(cart)
+
+    def clear(self):
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+
+
+class DatabaseCartStore:
+    #One CartItem row per line: changes are row upserts/deletes, loading joins shop_good
+    def __init__(self, user):
+        self.user = user
+        self._goods = {}
+
+    def load(self):
+        items = CartItem.objects.filter(user=self.user).select_related("good").order_by("id")
+        self._goods = {item.good_id: item.good for item in items}
+        return {item.good_id: [item.amount, item.price_cents] for item in items}
+
+    def goods(self, good_ids):
+        missing = [good_id for good_id in good_ids if good_id not in self._goods]
+        if missing:
+            self._goods.update(Good.objects.in_bulk(missing))
+        return {good_id: self._goods[good_id] for good_id in good_ids if good_id in self._goods}
+
+    def save(self, cart, changed=(), removed=()):
+        #One upsert for changed lines, one DELETE for removed ones; atomic only when both run
+        with transaction.atomic() if changed and removed else nullcontext():
+            if changed:
+                _upsert([
+                    CartItem(user=self.user, good_id=good_id, amount=cart[good_id][0], price_cents=cart[good_id][1])
+                    for good_id in changed
+                ])
+            if removed:
+                CartItem.objects.filter(user=self.user, good_id__in=list(removed)).delete()
+
+    def clear(self):
+        CartItem.objects.filter(user=self.user).delete()
+
+
+def _upsert(items):
+    #INSERT ... ON CONFLICT (user, good) DO UPDATE: one statement whatever the line count
+    CartItem.objects.bulk_create(
+        items,
+        update_conflicts=True,
+        unique_fields=["user", "good"],
+        update_fields=["amount", "price_cents"],
+    )
+
+
+def database_carts_enabled():
+    return getattr(settings, "CART_BACKEND", "session") == "db"
+
+
+def cart_store(request):
+    if database_carts_enabled() and request.user.is_authenticated:
+        return DatabaseCartStore(request.user)
+    return SessionCartStore(request)
+
+
+def merge_session_cart(request, user):
+    """Move the anonymous session cart into the user's stored cart.
+
+    Lines for goods already in the stored cart take the session's amount
+    and price; all lines are written with one upsert.
+    """
+    if not database_carts_enabled():
+        return
+    cart = decode_cart(request.session.get(settings.CART_SESSION_ID))
+    if cart:
+        #Goods deleted since they were added would violate the foreign key
+        existing = set(Good.objects.filter(id__in=list(cart)).values_list("id", flat=True))
+        _upsert([
+            CartItem(user=user, good_id=good_id, amount=amount, price_cents=price)
+            for good_id, (amount, price) in cart.items()
+            if good_id in existing
+        ])
+    SessionCartStore(request).clear()
@@ -1,3 +1,390 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import mail
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cart.models import CartItem, IdempotencyKey, Order, OrderItem, OutboxEmail
+from cart.services import (
+    Cart,
+    CheckoutError,
+    IdempotencyError,
+    idempotent_response,
+    order_history,
+    place_order,
+    place_orders,
+    serialize_order,
+)
+from cart.services.outbox import deliver_batch, outbox_email
+from cart.signals import merge_cart_on_login
+from shop.models import Good
+from shop.api import orders_checkout_api
+from shopBoom.responses import FastJsonResponse
+from users.models import User, UserCredenetials
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        #bulk_create skips the user history signal
+        self.user = User.objects.bulk_create([User(username="buyer")])[0]
+        self.good = Good.objects.create(name="good", image="x.jpg")
+        self.orders = []
+        for day in (1, 2, 2, 3):
+            order = Order.objects.create(user=self.user, date=datetime.date(2024, 1, day))
+            OrderItem.objects.create(order=order, good=self.good, amount=2, price_at_purchase=1.25)
+            OrderItem.objects.create(order=order, good=self.good, amount=1, price_at_purchase=0.5)
+            self.orders.append(order)
+
+    def test_pages_newest_first_with_totals_in_fixed_queries(self):
+        with self.assertNumQueries(2):
+            page = order_history(self.user, 2)
+            payload = [serialize_order(order) for order in page]
+        self.assertEqual([o["order_id"] for o in payload], [self.orders[3].pk, self.orders[2].pk])
+        self.assertEqual(payload[0]["total"], 3.0)
+        self.assertEqual(payload[0]["items"][0], {"good": "good", "amount": 2, "price": 1.25})
+
+        rest = order_history(self.user, 2, after=page.next_cursor)
+        self.assertEqual([o.pk for o in rest], [self.orders[1].pk, self.orders[0].pk])
+        self.assertIsNone(rest.next_cursor)
+
+        ranged = order_history(self.user, 10, date_from=datetime.date(2024, 1, 2), date_to=datetime.date(2024, 1, 2))
+        self.assertEqual(len(ranged), 2)
+
+    def test_tampered_cursor_is_a_bad_request(self):
+        import base64
+
+        from shop.api import orders_api
+
+        for values in (["-date", "notadate", 1], ["-date", ["2024-01-02"], 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            request = RequestFactory().get("/api/orders/", {"after": cursor})
+            request.user = self.user
+            self.assertEqual(orders_api(request).status_code, 400)
+
+
+class CartSnapshotTests(TestCase):
+    def test_one_goods_query_per_request_until_the_cart_changes(self):
+        goods = [Good.objects.create(name=f"good-{i}", amount=5, cost=1.5, image="x.jpg") for i in range(3)]
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        cart = Cart(request)
+        for good in goods:
+            cart.add(good, 2)
+
+        with self.assertNumQueries(1):
+            lines = list(cart)
+            self.assertEqual(Cart(request).get_total_price(), Decimal("9.0"))
+            self.assertEqual(len(cart.snapshot()), 6)
+        self.assertEqual([line.good for line in lines], goods)
+        self.assertEqual(lines[0].total_price, Decimal("3.0"))
+        self.assertEqual(request.session[settings.CART_SESSION_ID]["qty"], [2, 2, 2])
+
+        cart.remove(goods[0])
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.get_total_price(), Decimal("6.0"))
+
+    def test_session_is_only_rewritten_on_real_changes(self):
+        good = Good.objects.create(name="good", amount=3, cost=2.25, image="x.jpg")
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        #A v1 cart left over from before the compact layout
+        request.session[settings.CART_SESSION_ID] = {str(good.pk): {"amount": 3, "price_at_purchase": "2.25"}}
+        request.session.modified = False
+        cart = Cart(request)
+
+        cart.add(good, 5)
+        cart.add(good, 3, override_quantity=True)
+        cart.remove(Good(id=good.pk + 1))
+        self.assertFalse(request.session.modified)
+        self.assertEqual(cart.get_total_price(), Decimal("6.75"))
+
+        cart.add(good, 1, override_quantity=True)
+        self.assertTrue(request.session.modified)
+        self.assertEqual(
+            request.session[settings.CART_SESSION_ID],
+            {"v": 2, "ids": [good.pk], "qty": [1], "cents": [225]},
+        )
+
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        self.assertEqual(len(Cart(request)), 0)
+        self.assertFalse(request.session.modified)
+
+
+class CartBatchUpdateTests(TestCase):
+    def test_one_goods_query_and_no_transaction_for_a_session_cart(self):
+        goods = [Good.objects.create(name=f"good-{i}", amount=3, cost=2, image="x.jpg") for i in range(3)]
+        self.client.post(reverse("cart_add", args=[goods[0].pk]), {"quantity": 1})
+        lines = [{"good_id": goods[0].pk, "amount": 0}] + [{"good_id": good.pk, "amount": 5} for good in goods[1:]]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("cart_batch_update"), json.dumps({"lines": lines}), content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 6)
+        self.assertEqual([item["good_id"] for item in response.json()["items"]], [goods[1].pk, goods[2].pk])
+        sql = [query["sql"] for query in queries]
+        self.assertEqual(len([q for q in sql if "shop_good" in q]), 1)
+        #The only savepoint is the session backend's own save
+        self.assertTrue(all("django_session" in sql[i + 1] for i, q in enumerate(sql) if q.startswith("SAVEPOINT")))
+
+        response = self.client.post(
+            reverse("cart_batch_update"),
+            json.dumps({"lines": [{"good_id": goods[1].pk, "amount": 1}, {"good_id": 0, "amount": 1}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["good_ids"], [0])
+        self.assertEqual(self.client.get(reverse("cart_summarry")).context["cart_total"], Decimal("12"))
+
+
+@override_settings(CART_BACKEND="db")
+class DatabaseCartTests(TestCase):
+    def _request(self, user, session):
+        request = RequestFactory().get("/")
+        request.user = user
+        request.session = session
+        return request
+
+    def test_login_merges_the_session_cart_and_lines_load_with_their_goods(self):
+        user = User.objects.bulk_create([User(username="buyer")])[0]
+        goods = [Good.objects.create(name=f"good-{i}", amount=5, cost=1.5, image="x.jpg") for i in range(3)]
+        CartItem.objects.create(user=user, good=goods[0], amount=4, price_cents=100)
+        CartItem.objects.create(user=user, good=goods[2], amount=1, price_cents=150)
+
+        session = SessionStore()
+        anonymous = Cart(self._request(AnonymousUser(), session))
+        anonymous.add(goods[0], 2)
+        anonymous.add(goods[1], 3)
+        with self.assertNumQueries(2):
+            #Sending user_logged_in itself would also save last_login (and the user's history)
+            merge_cart_on_login(sender=User, request=self._request(user, session), user=user)
+        self.assertNotIn(settings.CART_SESSION_ID, session)
+
+        request = self._request(user, session)
+        with self.assertNumQueries(1):
+            cart = Cart(request)
+            lines = list(cart)
+            self.assertEqual(len(cart), 6)
+        self.assertEqual([(line.good, line.amount) for line in lines], [(goods[0], 2), (goods[2], 1), (goods[1], 3)])
+
+        cart.add(goods[2], 1)
+        cart.remove(goods[1])
+        self.assertEqual(
+            list(CartItem.objects.filter(user=user).order_by("id").values_list("good_id", "amount")),
+            [(goods[0].pk, 2), (goods[2].pk, 2)],
+        )
+        self.assertEqual(cart.get_total_price(), Decimal("6.0"))
+        cart.clear()
+        self.assertFalse(CartItem.objects.exists())
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.bulk_create([User(username="buyer")])[0]
+        #Free goods keep the bonus balance (and the user row) untouched
+        self.goods = [Good.objects.create(name=f"good-{i}", amount=5, image="x.jpg") for i in range(4)]
+
+    def _queries(self, goods):
+        with CaptureQueriesContext(connection) as queries:
+            place_order(self.user, "street", [(good.pk, 2, None) for good in goods])
+        return len(queries)
+
+    def test_statement_count_does_not_grow_with_cart_size(self):
+        self.assertEqual(self._queries(self.goods[:1]), self._queries(self.goods[1:]))
+        self.goods[1].refresh_from_db()
+        self.assertEqual(self.goods[1].amount, 3)
+        self.assertEqual(OrderItem.objects.filter(good=self.goods[1]).count(), 1)
+        self.assertEqual(self.goods[1].history.count(), 2)
+
+    def test_failed_line_rolls_back_the_whole_order(self):
+        lines = [(self.goods[0].pk, 1, None), (self.goods[1].pk, 3, None), (self.goods[1].pk, 3, None)]
+        with self.assertRaises(CheckoutError):
+            place_order(self.user, "street", lines)
+        self.assertFalse(Order.objects.exists())
+        self.goods[0].refresh_from_db()
+        self.assertEqual(self.goods[0].amount, 5)
+
+    def test_lock_free_mode_rejects_oversell_with_the_conditional_update(self):
+        good = self.goods[0]
+        with self.assertRaises(CheckoutError) as raised:
+            place_order(self.user, "street", [(self.goods[1].pk, 1, None), (good.pk, 6, None)], lock_free=True)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertFalse(Order.objects.exists())
+        self.goods[1].refresh_from_db()
+        self.assertEqual(self.goods[1].amount, 5)
+
+        place_order(self.user, "street", [(good.pk, 5, None)], lock_free=True)
+        good.refresh_from_db()
+        self.assertEqual(good.amount, 0)
+        self.assertEqual(good.history.first().amount, 0)
+
+    def test_group_commit_validates_in_arrival_order_against_shared_stock(self):
+        other = User.objects.bulk_create([User(username="other")])[0]
+        good = self.goods[0]
+        requests = [
+            (self.user, "street", [(good.pk, 3, None)], Decimal("0.00")),
+            (other, "avenue", [(good.pk, 3, None)], Decimal("0.00")),
+            (other, "avenue", [(good.pk, 2, None), (self.goods[1].pk, 1, None)], Decimal("0.00")),
+        ]
+        outcomes = place_orders(requests)
+
+        self.assertIsInstance(outcomes[1], CheckoutError)
+        self.assertEqual([o.order.user_id for o in (outcomes[0], outcomes[2])], [self.user.pk, other.pk])
+        self.assertEqual(len(outcomes[2].items), 2)
+        self.assertEqual(Order.objects.count(), 2)
+        good.refresh_from_db()
+        self.assertEqual(good.amount, 0)
+        self.assertEqual(good.history.first().amount, 0)
+
+    @override_settings(SHARDED_STOCK=True)
+    def test_deferred_failure_does_not_replay_the_committed_batch(self):
+        from concurrent.futures import Future
+
+        from django.db import OperationalError
+
+        from cart.services.batcher import CheckoutBatcher
+        from shop.services.stock import shard_stock
+
+        shard_stock(self.goods[1], 2)
+        batch = [
+            (Future(), (self.user, "street", [(self.goods[0].pk, 1, None)], Decimal("0.00"))),
+            (Future(), (self.user, "street", [(self.goods[1].pk, 1, None)], Decimal("0.00"))),
+        ]
+        with mock.patch("cart.services.checkout.place_order", side_effect=OperationalError("deadlock")):
+            CheckoutBatcher().commit(batch)
+
+        self.assertEqual(batch[0][0].result().order.user_id, self.user.pk)
+        self.assertIsInstance(batch[1][0].exception(), OperationalError)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class IdempotentCheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.bulk_create([User(username="buyer", email="buyer@example.com")])[0]
+        UserCredenetials.objects.bulk_create([UserCredenetials(user=self.user, phonenumber="+70000000000")])
+        self.good = Good.objects.create(name="good", amount=5, image="x.jpg")
+
+    def _post(self, amount, key="retry-1"):
+        body = json.dumps({"items": [{"good_id": self.good.pk, "amount": amount}], "address": "street"})
+        request = RequestFactory().post(
+            "/api/orders/checkout/", body, content_type="application/json", HTTP_IDEMPOTENCY_KEY=key
+        )
+        request.user = self.user
+        return orders_checkout_api(request)
+
+    def test_retry_replays_the_stored_response_without_touching_stock(self):
+        first = self._post(2)
+        self.assertEqual(first.status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self._post(2)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertFalse([q for q in queries if "shop_good" in q["sql"] or "users_user" in q["sql"]])
+        self.assertEqual(Order.objects.count(), 1)
+        self.good.refresh_from_db()
+        self.assertEqual(self.good.amount, 3)
+
+        self.assertEqual(self._post(3).status_code, 422)
+        self.assertEqual(self._post(2, key="retry-2").status_code, 201)
+
+    def test_server_errors_release_the_key(self):
+        with self.assertRaises(RuntimeError):
+            idempotent_response(self.user, "boom", b"{}", self._fail)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0, IDEMPOTENCY_LEASE_SECONDS=300)
+    def test_slow_claims_are_only_taken_over_after_the_lease(self):
+        import hashlib
+
+        from django.utils import timezone
+
+        body = b"{}"
+        started = timezone.now() - datetime.timedelta(seconds=60)
+        claim = IdempotencyKey.objects.create(
+            user=self.user, key="slow", fingerprint=hashlib.sha256(body).hexdigest(), created=started
+        )
+        #Past the wait window but inside the lease: still the first worker's
+        with self.assertRaises(IdempotencyError):
+            idempotent_response(self.user, "slow", body, self._fail)
+
+        IdempotencyKey.objects.filter(pk=claim.pk).update(created=started - datetime.timedelta(seconds=300))
+        response = idempotent_response(self.user, "slow", body, lambda: FastJsonResponse({}, status=201))
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(IDEMPOTENCY_TTL=3600)
+    def test_keys_expire_after_the_ttl(self):
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        self.assertEqual(self._post(2).status_code, 201)
+        self._post(1, key="fresh")
+        IdempotencyKey.objects.filter(key="retry-1").update(created=timezone.now() - datetime.timedelta(hours=2))
+
+        #An expired key is not replayed, even before the purge has run
+        retry = self._post(2)
+        self.assertEqual(retry.status_code, 201)
+        self.assertFalse(retry.has_header("Idempotent-Replayed"))
+        self.assertEqual(Order.objects.count(), 3)
+
+        IdempotencyKey.objects.update(created=timezone.now() - datetime.timedelta(hours=2))
+        IdempotencyKey.objects.filter(key="fresh").update(created=timezone.now())
+        out = io.StringIO()
+        call_command("purge_idempotency_keys", stdout=out)
+        self.assertIn("Purged 1 ", out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["fresh"])
+
+    @staticmethod
+    def _fail():
+        raise RuntimeError("lost the database")
+
+
+class OutboxTests(TestCase):
+    def test_confirmation_is_queued_with_the_order_and_sent_by_the_worker(self):
+        user = User.objects.bulk_create([User(username="buyer", email="buyer@example.com")])[0]
+        good = Good.objects.create(name="good", amount=5, image="x.jpg")
+        placed = place_order(user, "street", [(good.pk, 2, None)])
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual(queued.subject, f"ShopBoom order #{placed.order.pk}")
+
+        self.assertEqual(deliver_batch(mail.get_connection()), 1)
+        self.assertEqual(mail.outbox[0].to, ["buyer@example.com"])
+        self.assertIn("- good x2", mail.outbox[0].body)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (OutboxEmail.SENT, 1))
+        self.assertEqual(deliver_batch(mail.get_connection()), 0)
+
+    def test_failed_sends_back_off_then_give_up(self):
+        rows = OutboxEmail.objects.bulk_create(
+            [outbox_email("s", "b", ["bad@example.com"]), outbox_email("s", "b", ["ok@example.com"])]
+        )
+        connection = mail.get_connection()
+        refused = SMTPRecipientsRefused({"bad@example.com": (550, b"no such user")})
+        with mock.patch.object(connection, "send_messages", side_effect=[refused, 1]):
+            self.assertEqual(deliver_batch(connection), 2)
+        bad, ok = OutboxEmail.objects.order_by("id")
+        self.assertEqual(ok.status, OutboxEmail.SENT)
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIn("SMTPRecipientsRefused", bad.last_error)
+        #Not due again until the backoff has passed
+        self.assertEqual(deliver_batch(connection), 0)
+
+        OutboxEmail.objects.filter(pk=bad.pk).update(available_at=rows[0].created)
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2), mock.patch.object(connection, "send_messages", side_effect=refused):
+            with self.assertLogs("cart.services.outbox", "ERROR"):
+                deliver_batch(connection)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.FAILED, 2))
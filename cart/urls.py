@@ -6,5 +6,6 @@ urlpatterns = [
     path('add/<int:pk>/', cart_add, name='cart_add'),
     path('delete/<int:pk>/', cart_delete, name='cart_delete'),
     path('update/<int:pk>/', cart_update, name='cart_update'),
+    path('batch/', cart_batch_update, name='cart_batch_update'),
     path('checkout/', cart_checkout, name='cart_checkout'),
 ]
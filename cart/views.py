@@ -1,16 +1,19 @@
+import json
 from decimal import Decimal
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.views.decorators.http import require_POST
-from django.conf import settings
-from django.core.mail import send_mail
 from shop.models import Good
-from users.models import UserCredenetials, User
-from cart.services import Cart
+from shop.services.stock import stock_amount
+from users.models import UserCredenetials
+from shopBoom.responses import FastJsonResponse
+from cart.services import Cart, CheckoutError, serialize_cart, submit_order
+from cart.services.checkout import STOCK_ERROR
 from cart.services.bonus import apply_bonus, parse_bonus
-from .models import Order, OrderItem
+
+CART_BATCH_MAX_LINES = 200
 
 def _build_cart_context(
     cart,
@@ -22,9 +25,10 @@ def _build_cart_context(
     bonus_earned=None,
     total_after=None,
 ):
+    snapshot = cart.snapshot()
     context = {
-        "cart": cart,
-        "cart_total": cart.get_total_price(),
+        "cart": snapshot,
+        "cart_total": snapshot.total_price,
         "error": error,
         "address": address,
     }
@@ -85,8 +89,9 @@ def cart_add(request, pk):
     except (TypeError, ValueError):
         quantity = 1
     quantity = max(quantity, 1)
-    if good.amount > 0:
-        quantity = min(quantity, good.amount)
+    stock = stock_amount(good)
+    if stock > 0:
+        quantity = min(quantity, stock)
     cart.add(
         good=good,
         amount=quantity,
@@ -112,8 +117,9 @@ def cart_update(request, pk):
     except (TypeError, ValueError):
         quantity = 1
     quantity = max(quantity, 1)
-    if good.amount > 0:
-        quantity = min(quantity, good.amount)
+    stock = stock_amount(good)
+    if stock > 0:
+        quantity = min(quantity, stock)
     cart.add(
         good=good,
         amount=quantity,
@@ -121,12 +127,28 @@ def cart_update(request, pk):
     )
     return redirect("cart_summarry")
 
+@require_POST
+def cart_batch_update(request):
+    #No transaction: session carts write no rows and the db store wraps its own two statements
+    try:
+        lines = json.loads(request.body.decode("utf-8"))["lines"]
+        changes = {int(line["good_id"]): int(line["amount"]) for line in lines}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return FastJsonResponse({"error": "Expected {\"lines\": [{\"good_id\": ..., \"amount\": ...}]}"}, status=400)
+    if len(changes) > CART_BATCH_MAX_LINES:
+        return FastJsonResponse({"error": f"At most {CART_BATCH_MAX_LINES} lines per request"}, status=400)
+    cart = Cart(request)
+    unknown = cart.update(changes)
+    if unknown:
+        return FastJsonResponse({"error": "Unknown goods", "good_ids": unknown}, status=404)
+    return FastJsonResponse(serialize_cart(cart.snapshot()))
+
 @transaction.atomic
 @login_required
 @require_POST
 def cart_checkout(request):
     cart = Cart(request)
-    if len(cart) == 0:
+    if len(cart.snapshot()) == 0:
         context = _build_cart_context(cart, error="Cart is empty.")
         return render(request, "cart/cart_summary.html", context)
 
@@ -172,97 +194,27 @@ def cart_checkout(request):
         )
         return render(request, "cart/cart_summary.html", context)
 
-    items = list(cart)
-    total_value = cart.get_total_price()
-    good_ids = [item["good"].id for item in items]
-    with transaction.atomic():
-        user = User.objects.select_for_update().get(pk=request.user.pk)
+    lines = [(item.good.id, item.amount, item.price_at_purchase) for item in cart.snapshot()]
+    try:
+        submit_order(request.user, address, lines, bonus_request)
+    except CheckoutError:
+        bonus_available = request.user.bonus or Decimal("0.00")
         bonus_used, bonus_earned, total_after = apply_bonus(
-            user.bonus or Decimal("0.00"),
-            total_value,
+            bonus_available,
+            cart.get_total_price(),
             bonus_request,
         )
-        goods = {g.id: g for g in Good.objects.select_for_update().filter(id__in=good_ids)}
-        for item in items:
-            good = goods.get(item["good"].id)
-            if not good or good.amount < item["amount"]:
-                context = _build_cart_context(
-                    cart,
-                    error="Not enough stock for one or more items.",
-                    address=address,
-                    bonus_available=user.bonus or Decimal("0.00"),
-                    bonus_to_use=bonus_request,
-                    bonus_used=bonus_used,
-                    bonus_earned=bonus_earned,
-                    total_after=total_after,
-                )
-                return render(request, "cart/cart_summary.html", context)
-
-        order = Order.objects.create(user=request.user, address=address)
-        for item in items:
-            good = goods[item["good"].id]
-            OrderItem.objects.create(
-                order=order,
-                good=good,
-                user=request.user,
-                amount=item["amount"],
-                price_at_purchase=float(item["price_at_purchase"]),
-            )
-            good.amount = good.amount - item["amount"]
-            good.save(update_fields=["amount"])
-        user.bonus = (user.bonus or Decimal("0.00")) - bonus_used + bonus_earned
-        user.save(update_fields=["bonus"])
-
+        context = _build_cart_context(
+            cart,
+            error=STOCK_ERROR,
+            address=address,
+            bonus_available=bonus_available,
+            bonus_to_use=bonus_request,
+            bonus_used=bonus_used,
+            bonus_earned=bonus_earned,
+            total_after=total_after,
+        )
+        return render(request, "cart/cart_summary.html", context)
+    #The confirmation email was queued in the checkout transaction (manage.py send_outbox)
     cart.clear()
-    _send_order_confirmation(
-        request.user,
-        order,
-        items,
-        total_after,
-        address,
-        bonus_used=bonus_used,
-        bonus_earned=bonus_earned,
-    )
     return redirect("cart_summarry")
-
-
-
-@transaction.atomic
-def _send_order_confirmation(
-    user,
-    order,
-    items,
-    total,
-    address,
-    bonus_used=Decimal("0.00"),
-    bonus_earned=Decimal("0.00"),
-):
-    if not user.email:
-        return
-    lines = [
-        f"Thank you for your purchase, {user.username}!",
-        f"Order #{order.id} summary:",
-        "",
-    ]
-    for item in items:
-        lines.append(
-            f"- {item['good'].name} x{item['amount']} - ${item['total_price']:.2f}"
-        )
-    lines.extend(
-        [
-            "",
-            f"Bonus used: ${bonus_used:.2f}",
-            f"Bonus earned: ${bonus_earned:.2f}",
-            f"Total charged: ${total:.2f}",
-            f"Shipping address: {address}",
-            "",
-            "If you have questions, reply to this message.",
-        ]
-    )
-    send_mail(
-        f"ShopBoom order #{order.id}",
-        "\n".join(lines),
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=True,
-    )
@@ -7,5 +7,6 @@ admin.site.register(Company, SimpleHistoryAdmin)
 admin.site.register(Type, SimpleHistoryAdmin)
 admin.site.register(Good, SimpleHistoryAdmin)
 admin.site.register(Rate, SimpleHistoryAdmin)
+admin.site.register(StockSlot)
 
 
@@ -1,36 +1,86 @@
+import datetime
 import json
-from decimal import Decimal
 from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
 
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.http import JsonResponse
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.utils.cache import patch_vary_headers
 from django.db.models import F
-from cart.models import Order, OrderItem
-from cart.services.bonus import apply_bonus, parse_bonus
-from users.models import UserCredenetials, User
+from cart.services import (
+    CheckoutError,
+    IdempotencyError,
+    aorder_history,
+    order_history,
+    idempotent_response,
+    serialize_order,
+    submit_order,
+)
+from cart.services.bonus import parse_bonus
+from users.models import UserCredenetials
+from users.services.roles import arequest_roles, request_roles
 from shop.models import Good
+from shopBoom.responses import FastJsonResponse, dumps, negotiated_response
+from shop.filters import GoodFilter
+from shop.services.reference import reference_name
+from shop.services.conditional import (
+    conditional_view,
+    good_etag,
+    good_last_modified,
+    goods_etag,
+    goods_last_modified,
+    orders_etag,
+    orders_last_modified,
+)
+from shop.services import akeyset_paginate, keyset_paginate, InvalidCursor
+from shop.services.pagination import CURSOR_PARAMS, DEFAULT_SORT, SORT_ORDERINGS
+from shop.services.bulk import BULK_MAX_ROWS, upsert_goods
+from shop.services.stock import sharded_stock, sharding_enabled, stock_amount
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+ORDERS_PAGE_SIZE = 50
+EXPORT_CHUNK_SIZE = 2000
+
+#?fields= projection: output field -> values() columns it needs
+GOOD_FIELDS = {
+    "id": ("id",),
+    "name": ("name",),
+    "amount": ("id", "amount"),
+    "cost": ("cost",),
+    "type": ("type__name",),
+    "company": ("company__name",),
+    "image": ("image",),
+    "characteristics": ("max_voltage", "capacity", "resistance"),
+}
+DEFAULT_GOOD_FIELDS = ("id", "name", "amount", "cost", "type", "company")
 
 ROLE_ALLOW_LIST = {"warehouse", "admin"}
 
 
+def _has_manager_role(request):
+    return not ROLE_ALLOW_LIST.isdisjoint(request_roles(request))
+
+
 def _manager_required(view_func):
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_wrapped(request, *args, **kwargs):
+            if ROLE_ALLOW_LIST.isdisjoint(await arequest_roles(request)):
+                return FastJsonResponse({"error": "Requires warehouse or admin role"}, status=403)
+            return await view_func(request, *args, **kwargs)
+
+        return _async_wrapped
+
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
-        user = request.user
-        has_role = (
-            user.is_authenticated
-            and (
-                user.is_staff
-                or user.is_superuser
-                or (user.role and user.role.rolename.lower() in ROLE_ALLOW_LIST)
-            )
-        )
-        if not has_role:
-            return JsonResponse({"error": "Requires warehouse or admin role"}, status=403)
+        if not _has_manager_role(request):
+            return FastJsonResponse({"error": "Requires warehouse or admin role"}, status=403)
         return view_func(request, *args, **kwargs)
 
     return _wrapped
@@ -40,58 +90,326 @@ def _serialize_good(good):
     return {
         "id": good.id,
         "name": good.name,
-        "amount": good.amount,
+        "amount": stock_amount(good),
         "cost": str(good.cost),
-        "type": good.type.name if good.type else None,
-        "company": good.company.name if good.company else None,
+        "type": reference_name("type", good.type_id),
+        "company": reference_name("company", good.company_id),
     }
 
 
+def _parse_fields(request):
+    raw = request.GET.get("fields")
+    if not raw:
+        return DEFAULT_GOOD_FIELDS
+    fields = []
+    for field in raw.split(","):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in GOOD_FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+        fields.append(field)
+    if not fields:
+        raise ValueError("fields must name at least one field")
+    return tuple(fields)
+
+
+def _good_columns(fields, extra=()):
+    columns = list(extra)
+    for field in fields:
+        for column in GOOD_FIELDS[field]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def _stock_for(fields):
+    #Summed slot amounts for sharded goods, only when amount is requested
+    if "amount" not in fields or not sharding_enabled():
+        return {}
+    return sharded_stock()
+
+
+async def _astock_for(fields):
+    if "amount" not in fields or not sharding_enabled():
+        return {}
+    return await sync_to_async(sharded_stock)()
+
+
+def _serialize_row(row, fields, stock=None):
+    #row is a values() dict; no Good instance is ever built
+    item = {}
+    for field in fields:
+        if field == "amount":
+            item[field] = stock.get(row["id"], row["amount"]) if stock else row["amount"]
+        elif field == "cost":
+            item[field] = str(row["cost"])
+        elif field == "image":
+            item[field] = Good._meta.get_field("image").storage.url(row["image"]) if row["image"] else None
+        elif field == "characteristics":
+            item[field] = {column: row[column] for column in GOOD_FIELDS[field]}
+        else:
+            item[field] = row[GOOD_FIELDS[field][0]]
+    return item
+
+
+def _export_rows(queryset, fields):
+    #Server-side cursor on PostgreSQL; only the requested columns and joins are selected
+    stock = _stock_for(fields)
+    rows = queryset.order_by("id").values(*_good_columns(fields)).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in rows:
+        yield _serialize_row(row, fields, stock)
+
+
+async def _aexport_rows(queryset, fields):
+    stock = await _astock_for(fields)
+    rows = queryset.order_by("id").values(*_good_columns(fields)).aiterator(chunk_size=EXPORT_CHUNK_SIZE)
+    async for row in rows:
+        yield _serialize_row(row, fields, stock)
+
+
+def _export_piece(row, ndjson, first):
+    encoded = dumps(row).decode("utf-8")
+    if ndjson:
+        return encoded + "\n"
+    return encoded if first else "," + encoded
+
+
+def _export_chunks(queryset, fields, ndjson):
+    buffer = []
+    if not ndjson:
+        yield '{"goods": ['
+    for index, row in enumerate(_export_rows(queryset, fields)):
+        buffer.append(_export_piece(row, ndjson, index == 0))
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+    if not ndjson:
+        yield "]}"
+
+
+async def _aexport_chunks(queryset, fields, ndjson):
+    #Async iterator body: only the ASGI handler streams it without buffering
+    buffer = []
+    first = True
+    if not ndjson:
+        yield '{"goods": ['
+    async for row in _aexport_rows(queryset, fields):
+        buffer.append(_export_piece(row, ndjson, first))
+        first = False
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+    if not ndjson:
+        yield "]}"
+
+
+def _goods_export(queryset, fields, ndjson=False, chunks=_export_chunks):
+    content_type = "application/x-ndjson" if ndjson else "application/json"
+    return StreamingHttpResponse(chunks(queryset, fields, ndjson), content_type=content_type)
+
+
+def _page_args(request, fields):
+    #keyset_paginate() keyword arguments from the query string; ValueError on bad input
+    try:
+        limit = int(request.GET.get("limit", API_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    total = request.GET.get("total")
+    if total not in (None, "approx", "exact"):
+        raise ValueError("total must be 'approx' or 'exact'")
+    sort = request.GET.get("sort") or DEFAULT_SORT
+    #The cursor is built from the sort columns, so they are always selected
+    sort_columns = [ordering.lstrip("-") for ordering in SORT_ORDERINGS.get(sort, ())]
+    return {
+        "columns": _good_columns(fields, sort_columns),
+        "limit": min(max(limit, 1), API_MAX_PAGE_SIZE),
+        "sort": sort,
+        "after": request.GET.get("after"),
+        "before": request.GET.get("before"),
+        "total": total,
+    }
+
+
+def _page_payload(page, fields, stock, total):
+    payload = {
+        "goods": [_serialize_row(row, fields, stock) for row in page],
+        "next": page.next_cursor,
+        "previous": page.previous_cursor,
+    }
+    if total:
+        payload["total"] = page.total
+        payload["total_exact"] = page.total_is_exact
+    return payload
+
+
+def _goods_page(request, queryset, fields):
+    try:
+        args = _page_args(request, fields)
+        page = keyset_paginate(queryset.values(*args.pop("columns")), **args)
+    except (ValueError, InvalidCursor) as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    return negotiated_response(request, _page_payload(page, fields, _stock_for(fields), args["total"]))
+
+
+async def _agoods_page(request, queryset, fields):
+    try:
+        args = _page_args(request, fields)
+        page = await akeyset_paginate(queryset.values(*args.pop("columns")), **args)
+    except (ValueError, InvalidCursor) as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    return negotiated_response(request, _page_payload(page, fields, await _astock_for(fields), args["total"]))
+
+
+def _wants_page(request):
+    return "limit" in request.GET or any(request.GET.get(p) for p in CURSOR_PARAMS)
+
+
 @require_http_methods(["GET", "POST"])
 @csrf_exempt
+@conditional_view(etag_func=goods_etag, last_modified_func=goods_last_modified)
 def goods_api(request):
-    if request.method == "GET":
-        goods = [ _serialize_good(g) for g in Good.objects.all() ]
-        return JsonResponse({"goods": goods})
+    if request.method != "GET":
+        return _create_good(request)
+
+    queryset, errors = _filtered_goods(request.GET)
+    if errors:
+        return FastJsonResponse({"error": errors}, status=400)
+    try:
+        fields = _parse_fields(request)
+    except ValueError as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    export_format = request.GET.get("format")
+    if export_format in ("ndjson", "stream"):
+        return _goods_export(queryset, fields, ndjson=export_format == "ndjson")
+    if _wants_page(request):
+        return _goods_page(request, queryset, fields)
+    rows = queryset.values(*_good_columns(fields))
+    stock = _stock_for(fields)
+    return negotiated_response(request, {"goods": [_serialize_row(row, fields, stock) for row in rows]})
 
+
+@require_http_methods(["GET", "POST"])
+@csrf_exempt
+@conditional_view(etag_func=goods_etag, last_modified_func=goods_last_modified)
+async def agoods_api(request):
+    #goods_api for the ASGI URLconf
+    if request.method != "GET":
+        return await sync_to_async(_create_good)(request)
+
+    queryset, errors = await sync_to_async(_filtered_goods)(request.GET)
+    if errors:
+        return FastJsonResponse({"error": errors}, status=400)
+    try:
+        fields = _parse_fields(request)
+    except ValueError as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    export_format = request.GET.get("format")
+    if export_format in ("ndjson", "stream"):
+        return _goods_export(queryset, fields, ndjson=export_format == "ndjson", chunks=_aexport_chunks)
+    if _wants_page(request):
+        return await _agoods_page(request, queryset, fields)
+    rows = queryset.values(*_good_columns(fields))
+    stock = await _astock_for(fields)
+    goods = [_serialize_row(row, fields, stock) async for row in rows]
+    return negotiated_response(request, {"goods": goods})
+
+
+def _filtered_goods(params):
+    #Choice lists and the bitmap index may hit the DB, so agoods_api runs this
+    #in a thread; the returned queryset is still unevaluated
+    goodFilter = GoodFilter(params, queryset=Good.objects.all())
+    if not goodFilter.is_valid():
+        return None, goodFilter.errors
+    return goodFilter.qs, None
+
+
+def _create_good(request):
     payload = {}
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON"}, status=400)
+        return FastJsonResponse({"error": "Invalid JSON"}, status=400)
 
     if not request.user.is_authenticated:
-        return JsonResponse({"error": "Authentication required"}, status=401)
-    user = request.user
-    has_role = (
-        user.is_staff
-        or user.is_superuser
-        or (user.role and user.role.rolename.lower() in ROLE_ALLOW_LIST)
-    )
-    if not has_role:
-        return JsonResponse({"error": "Requires warehouse or admin role"}, status=403)
+        return FastJsonResponse({"error": "Authentication required"}, status=401)
+    if not _has_manager_role(request):
+        return FastJsonResponse({"error": "Requires warehouse or admin role"}, status=403)
 
     name = payload.get("name")
     amount = payload.get("amount", 0)
     cost = payload.get("cost", 0)
     if not name:
-        return JsonResponse({"error": "Name is required"}, status=400)
+        return FastJsonResponse({"error": "Name is required"}, status=400)
 
     good = Good.objects.create(
         name=name,
         amount=int(amount),
         cost=float(cost),
     )
-    return JsonResponse({"good": _serialize_good(good)}, status=201)
+    return FastJsonResponse({"good": _serialize_good(good)}, status=201)
+
+
+@require_http_methods(["POST"])
+@csrf_exempt
+@_manager_required
+def goods_bulk_api(request):
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except json.JSONDecodeError:
+        return FastJsonResponse({"error": "Invalid JSON"}, status=400)
+    records = payload.get("goods") if isinstance(payload, dict) else None
+    if not isinstance(records, list) or not records:
+        return FastJsonResponse({"error": "goods must be a non-empty list"}, status=400)
+    if len(records) > BULK_MAX_ROWS:
+        return FastJsonResponse({"error": f"At most {BULK_MAX_ROWS} goods per request"}, status=413)
+
+    results = upsert_goods(records)
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "error": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return FastJsonResponse({"results": results, "summary": summary})
 
 
 @require_http_methods(["GET", "PUT", "DELETE"])
 @csrf_exempt
+@conditional_view(etag_func=good_etag, last_modified_func=good_last_modified)
 def good_detail_api(request, pk):
-    good = get_object_or_404(Good, id=pk)
-    if request.method == "GET":
-        return JsonResponse(_serialize_good(good))
+    if request.method != "GET":
+        return _modify_good(request, pk)
+    try:
+        fields = _parse_fields(request)
+    except ValueError as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    row = Good.objects.filter(id=pk).values(*_good_columns(fields)).first()
+    if row is None:
+        raise Http404("No Good matches the given query.")
+    return negotiated_response(request, _serialize_row(row, fields, _stock_for(fields)))
+
+
+@require_http_methods(["GET", "PUT", "DELETE"])
+@csrf_exempt
+@conditional_view(etag_func=good_etag, last_modified_func=good_last_modified)
+async def agood_detail_api(request, pk):
+    #good_detail_api for the ASGI URLconf
+    if request.method != "GET":
+        return await sync_to_async(_modify_good)(request, pk)
+    try:
+        fields = _parse_fields(request)
+    except ValueError as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    row = await Good.objects.filter(id=pk).values(*_good_columns(fields)).afirst()
+    if row is None:
+        raise Http404("No Good matches the given query.")
+    return negotiated_response(request, _serialize_row(row, fields, await _astock_for(fields)))
+
 
+def _modify_good(request, pk):
+    good = get_object_or_404(Good, id=pk)
     if request.method == "DELETE":
         return _delete_good(request, good)
     if request.method == "PUT":
@@ -100,17 +418,17 @@ def good_detail_api(request, pk):
 
 def _update_good(request, good):
     if request.method != "PUT":
-        return JsonResponse({"error": "Method not allowed"}, status=405)
+        return FastJsonResponse({"error": "Method not allowed"}, status=405)
 
     if not request.user.is_authenticated:
-        return JsonResponse({"error": "Authentication required"}, status=401)
-    if not (request.user.is_staff or request.user.is_superuser or (request.user.role and request.user.role.rolename.lower() in ROLE_ALLOW_LIST)):
-        return JsonResponse({"error": "Requires warehouse or admin role"}, status=403)
+        return FastJsonResponse({"error": "Authentication required"}, status=401)
+    if not _has_manager_role(request):
+        return FastJsonResponse({"error": "Requires warehouse or admin role"}, status=403)
 
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON"}, status=400)
+        return FastJsonResponse({"error": "Invalid JSON"}, status=400)
 
     for field in ("name", "amount", "cost"):
         if field in payload:
@@ -120,48 +438,95 @@ def _update_good(request, good):
                 payload[field] if field != "amount" else int(payload[field]),
             )
     good.save()
-    return JsonResponse({"good": _serialize_good(good)})
+    return FastJsonResponse({"good": _serialize_good(good)})
 
 
 def _delete_good(request, good):
     if not request.user.is_authenticated:
-        return JsonResponse({"error": "Authentication required"}, status=401)
-    if not (request.user.is_staff or request.user.is_superuser or (request.user.role and request.user.role.rolename.lower() in ROLE_ALLOW_LIST)):
-        return JsonResponse({"error": "Requires warehouse or admin role"}, status=403)
+        return FastJsonResponse({"error": "Authentication required"}, status=401)
+    if not _has_manager_role(request):
+        return FastJsonResponse({"error": "Requires warehouse or admin role"}, status=403)
     good.delete()
-    return JsonResponse({"status": "deleted"})
+    return FastJsonResponse({"status": "deleted"})
+
+
+def _orders_args(request):
+    #order_history() keyword arguments from the query string; ValueError on bad input
+    try:
+        limit = int(request.GET.get("limit", ORDERS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    args = {
+        "limit": min(max(limit, 1), API_MAX_PAGE_SIZE),
+        "after": request.GET.get("after"),
+        "before": request.GET.get("before"),
+    }
+    for param in ("date_from", "date_to"):
+        value = request.GET.get(param)
+        if not value:
+            continue
+        try:
+            args[param] = datetime.date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{param} must be YYYY-MM-DD")
+    return args
+
+
+def _orders_response(request, page):
+    response = negotiated_response(request, {
+        "orders": [serialize_order(order) for order in page],
+        "next": page.next_cursor,
+        "previous": page.previous_cursor,
+    })
+    patch_vary_headers(response, ("Cookie",))
+    return response
 
 
 @login_required
 @require_http_methods(["GET"])
+@conditional_view(etag_func=orders_etag, last_modified_func=orders_last_modified)
 def orders_api(request):
-    orders = Order.objects.filter(user=request.user)
-    payload = []
-    for order in orders:
-        items = [
-            {
-                "good": item.good.name,
-                "amount": item.amount,
-                "price": item.price_at_purchase,
-            }
-            for item in order.fk_order.all()
-        ]
-        payload.append({"order_id": order.id, "date": str(order.date), "items": items})
-    return JsonResponse({"orders": payload})
+    try:
+        page = order_history(request.user, **_orders_args(request))
+    except (ValueError, InvalidCursor) as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    return _orders_response(request, page)
+
+
+@login_required
+@require_http_methods(["GET"])
+@conditional_view(etag_func=orders_etag, last_modified_func=orders_last_modified)
+async def aorders_api(request):
+    #orders_api for the ASGI URLconf
+    try:
+        page = await aorder_history(await request.auser(), **_orders_args(request))
+    except (ValueError, InvalidCursor) as exc:
+        return FastJsonResponse({"error": str(exc)}, status=400)
+    return _orders_response(request, page)
 
 
 @login_required
 @require_http_methods(["POST"])
 @csrf_exempt
 def orders_checkout_api(request):
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        return _checkout(request)
+    try:
+        return idempotent_response(request.user, key, request.body, lambda: _checkout(request))
+    except IdempotencyError as exc:
+        return FastJsonResponse({"error": exc.message}, status=exc.status)
+
+
+def _checkout(request):
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON"}, status=400)
+        return FastJsonResponse({"error": "Invalid JSON"}, status=400)
     items = payload.get("items", [])
     address = payload.get("address", "").strip()
     if not items or not address:
-        return JsonResponse({"error": "Items and address are required"}, status=400)
+        return FastJsonResponse({"error": "Items and address are required"}, status=400)
 
     missing_fields = []
     if not request.user.email:
@@ -174,58 +539,31 @@ def orders_checkout_api(request):
     if not phone:
         missing_fields.append("phone number")
     if missing_fields:
-        return JsonResponse(
+        return FastJsonResponse(
             {"error": f"Complete your profile with: {', '.join(missing_fields)}"},
             status=400,
         )
 
-    with transaction.atomic():
-        user = User.objects.select_for_update().get(pk=request.user.pk)
-        goods_map = {
-            good.id: good
-            for good in Good.objects.select_for_update().filter(
-                id__in=[item["good_id"] for item in items]
-            )
-        }
-        total_value = Decimal("0.00")
-        prepared_items = []
-        for item in items:
-            good = goods_map.get(item["good_id"])
-            if not good:
-                transaction.set_rollback(True)
-                return JsonResponse({"error": f"Product {item['good_id']} not found"}, status=404)
-            requested = int(item.get("amount", 1))
-            if requested < 1 or requested > good.amount:
-                transaction.set_rollback(True)
-                return JsonResponse({"error": f"Invalid quantity for {good.name}"}, status=400)
-            total_value += Decimal(str(good.cost)) * requested
-            prepared_items.append((good, requested))
-        bonus_request = parse_bonus(payload.get("bonus_to_use", "0"))
-        bonus_used, bonus_earned, total_after = apply_bonus(
-            user.bonus or Decimal("0.00"),
-            total_value,
-            bonus_request,
-        )
-        order = Order.objects.create(user=request.user, address=address)
-        for good, requested in prepared_items:
-            OrderItem.objects.create(
-                order=order,
-                good=good,
-                user=request.user,
-                amount=requested,
-                price_at_purchase=float(good.cost),
-            )
-            good.amount -= requested
-            good.save(update_fields=["amount"])
-        user.bonus = (user.bonus or Decimal("0.00")) - bonus_used + bonus_earned
-        user.save(update_fields=["bonus"])
-        return JsonResponse(
-            {
-                "order_id": order.id,
-                "status": "created",
-                "bonus_used": float(bonus_used),
-                "bonus_earned": float(bonus_earned),
-                "total_charged": float(total_after),
-            },
-            status=201,
+    try:
+        lines = [(item["good_id"], int(item.get("amount", 1)), None) for item in items]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return FastJsonResponse({"error": "Each item needs a good_id and an integer amount"}, status=400)
+    try:
+        placed = submit_order(
+            request.user,
+            address,
+            lines,
+            parse_bonus(payload.get("bonus_to_use", "0")),
         )
+    except CheckoutError as exc:
+        return FastJsonResponse({"error": exc.message}, status=exc.status)
+    return FastJsonResponse(
+        {
+            "order_id": placed.order.id,
+            "status": "created",
+            "bonus_used": float(placed.bonus_used),
+            "bonus_earned": float(placed.bonus_earned),
+            "total_charged": float(placed.total_after),
+        },
+        status=201,
+    )
@@ -1,5 +1,10 @@
+from functools import partial
+
 import django_filters
-from .models import Good, Tag, Type, Company
+from .models import Good
+from .services.reference import reference_choices
+from .services.search import search_goods
+from .services.bitmap import FACET_FIELDS, RANGE_FIELDS, facet_counts
 from django import forms
 
 
@@ -8,8 +13,8 @@ class GoodFilter(django_filters.FilterSet):
         label="Диапазон цены"
     )
 
-    tag = django_filters.ModelChoiceFilter(
-        queryset=Tag.objects.all(),
+    tag = django_filters.MultipleChoiceFilter(
+        choices=partial(reference_choices, "tag"),
         widget=forms.CheckboxSelectMultiple,
         label="Теги",
         error_messages={
@@ -17,8 +22,8 @@ class GoodFilter(django_filters.FilterSet):
         }
     )
 
-    type = django_filters.ModelChoiceFilter(
-        queryset=Type.objects.all(),
+    type = django_filters.ChoiceFilter(
+        choices=partial(reference_choices, "type"),
         empty_label="Все типы",
         widget=forms.RadioSelect,
         label="Тип компонента",
@@ -27,8 +32,8 @@ class GoodFilter(django_filters.FilterSet):
         },
     )
 
-    company = django_filters.ModelChoiceFilter(
-        queryset=Company.objects.all(),
+    company = django_filters.ChoiceFilter(
+        choices=partial(reference_choices, "company"),
         empty_label="Все производители",
         widget=forms.RadioSelect,
         label="Производитель",
@@ -37,14 +42,63 @@ class GoodFilter(django_filters.FilterSet):
         }
     )
 
+    max_voltage = django_filters.RangeFilter(
+        label="Максимальное напряжение (В)"
+    )
+
+    capacity = django_filters.RangeFilter(
+        label="Ёмкость"
+    )
+
+    resistance = django_filters.RangeFilter(
+        label="Сопротивление (Ом)"
+    )
+
     name = django_filters.CharFilter(
-        lookup_expr="icontains",
+        method="filter_name",
         label="Название",
         widget=forms.TextInput(attrs={
             "placeholder": "Введите название..."
         })
     )
 
+    def filter_name(self, queryset, name, value):
+        return search_goods(queryset, value)
+
+    def index_filters(self):
+        #Cleaned filter values in the shape CatalogIndex.match() expects
+        data = self.form.cleaned_data
+        filters = {}
+        for field in FACET_FIELDS:
+            value = data.get(field)
+            if isinstance(value, list):
+                if value:
+                    filters[field] = [int(pk) for pk in value]
+            elif value:
+                filters[field] = int(value)
+        for field in RANGE_FIELDS:
+            bounds = data.get(field)
+            if bounds:
+                filters[field] = (bounds.start, bounds.stop)
+        return filters
+
+    def facet_counts(self):
+        if not self.is_valid():
+            return {}
+        base_ids = None
+        if self.form.cleaned_data.get("name"):
+            base_ids = list(
+                search_goods(Good.objects.all(), self.form.cleaned_data["name"])
+                .values_list("id", flat=True)
+            )
+
+        def queryset_for(field):
+            data = self.data.copy()
+            data.pop(field, None)
+            return GoodFilter(data, queryset=Good.objects.all()).qs
+
+        return facet_counts(self.index_filters(), base_ids=base_ids, queryset_for=queryset_for)
+
     class Meta:
         model = Good
         fields = {
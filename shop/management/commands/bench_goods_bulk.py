@@ -0,0 +1,51 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import Good
+from shop.services.bulk import upsert_goods
+
+
+class Command(BaseCommand):
+    help = "Compare per-item goods writes with the bulk upsert path; all rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        inserts = [{"name": f"bulk-bench-{i}", "amount": i % 50, "cost": i % 100} for i in range(rows)]
+        updates = [dict(record, amount=record["amount"] + 1) for record in inserts]
+
+        for label, runner in (("per-item", self._per_item), ("bulk", self._bulk)):
+            with transaction.atomic():
+                insert_time = runner(inserts)
+                update_time = runner(updates)
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f"{label}: insert {rows / insert_time:,.0f} rows/s, "
+                f"update {rows / update_time:,.0f} rows/s"
+            )
+
+    @staticmethod
+    def _per_item(records):
+        #What POST /api/goods/ and PUT /api/goods/<pk>/ do for each record
+        started = time.perf_counter()
+        for record in records:
+            payload = json.loads(json.dumps(record))
+            good = Good.objects.filter(name=payload["name"]).first()
+            if good is None:
+                Good.objects.create(name=payload["name"], amount=int(payload["amount"]), cost=float(payload["cost"]))
+            else:
+                good.amount = int(payload["amount"])
+                good.cost = payload["cost"]
+                good.save()
+        return time.perf_counter() - started
+
+    @staticmethod
+    def _bulk(records):
+        started = time.perf_counter()
+        upsert_goods(json.loads(json.dumps(records)))
+        return time.perf_counter() - started
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+
+from shop.models import Good
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the read-only API through the WSGI handler on a thread pool and "
+        "through the ASGI handler on one event loop, with a simulated DB round-trip."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads")
+        parser.add_argument("--concurrency", type=int, default=64, help="in-flight ASGI requests")
+        parser.add_argument("--latency-ms", type=float, default=5.0, help="added to every query")
+
+    def handle(self, *args, **options):
+        good = Good.objects.order_by("id").first()
+        if good is None:
+            self.stderr.write("No goods to request; load some catalog data first")
+            return
+        paths = ["/api/goods/?limit=50", f"/api/goods/{good.pk}/", "/analytics/charts/goods/"]
+        requests = [paths[i % len(paths)] for i in range(options["requests"])]
+
+        #Warm the middleware singletons and catalog caches outside the timed runs
+        for path in paths:
+            Client().get(path)
+
+        latency = options["latency_ms"] / 1000
+
+        def _slow_query(execute, sql, params, many, context):
+            #Stands in for the network round-trip to a remote PostgreSQL
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def _install(sender, connection, **kwargs):
+            connection.execute_wrappers.append(_slow_query)
+
+        if latency:
+            connection_created.connect(_install, weak=False)
+        try:
+            self._report("WSGI", options["threads"], self._wsgi(requests, options["threads"]), requests)
+            self._report("ASGI", options["concurrency"], asyncio.run(self._asgi(requests, options["concurrency"])), requests)
+        finally:
+            connection_created.disconnect(_install)
+
+    def _report(self, label, workers, result, requests):
+        elapsed, statuses = result
+        failed = sum(1 for status in statuses if status != 200)
+        self.stdout.write(
+            f"{label} x{workers}: {len(requests) / elapsed:,.0f} req/s "
+            f"({elapsed:.2f}s, {failed} non-200)"
+        )
+
+    @staticmethod
+    def _wsgi(requests, threads):
+        def fetch(path):
+            return Client().get(path).status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            statuses = list(pool.map(fetch, requests))
+        return time.perf_counter() - started, statuses
+
+    @staticmethod
+    async def _asgi(requests, concurrency):
+        gate = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def fetch(path):
+            #ASGIHandler gives every request its own sync thread; the test client does not
+            async with gate, ThreadSensitiveContext():
+                return (await client.get(path)).status_code
+
+        #The async views are only routed through the ASGI entry point's URLconf
+        with override_settings(ROOT_URLCONF=settings.ASGI_URLCONF):
+            started = time.perf_counter()
+            statuses = await asyncio.gather(*(fetch(path) for path in requests))
+            return time.perf_counter() - started, statuses
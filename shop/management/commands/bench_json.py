@@ -0,0 +1,85 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from analytics.views import GoodsChartData, OrdersChartData
+from shop.api import DEFAULT_GOOD_FIELDS, GOOD_FIELDS, _good_columns, _serialize_row
+from shop.models import Good, Type
+from shopBoom import responses
+
+
+class Command(BaseCommand):
+    help = "Compare stdlib json, orjson and msgpack on real API and chart payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._seed(options["rows"])
+            self._run(options)
+            transaction.set_rollback(True)
+
+    def _run(self, options):
+        rows = options["rows"]
+        all_fields = tuple(GOOD_FIELDS)
+        payloads = {
+            "goods (default fields)": self._goods(DEFAULT_GOOD_FIELDS, rows),
+            "goods (all fields)": self._goods(all_fields, rows),
+            "goods chart": GoodsChartData().get_context_data(),
+            "orders chart": OrdersChartData().get_context_data(),
+        }
+        encoders = [("stdlib json", lambda data: json.dumps(data, cls=DjangoJSONEncoder).encode("utf-8"))]
+        if responses.ORJSON_AVAILABLE:
+            encoders.append(("orjson", responses.dumps))
+        else:
+            self.stdout.write("orjson is not installed; dumps() uses the stdlib fallback")
+        if responses.MSGPACK_AVAILABLE:
+            encoders.append(("msgpack", responses.packb))
+        else:
+            self.stdout.write("msgpack is not installed; skipping MessagePack")
+
+        for label, data in payloads.items():
+            self.stdout.write(label)
+            baseline = None
+            for name, encode in encoders:
+                elapsed, size = self._measure(encode, data, options["repeat"])
+                baseline = baseline or elapsed
+                self.stdout.write(
+                    f"  {name:12} {elapsed * 1000:8.3f} ms  {size:>10,} bytes  x{baseline / elapsed:.1f}"
+                )
+
+    @staticmethod
+    def _seed(rows):
+        #Top the catalog up with synthetic goods; rolled back afterwards
+        missing = rows - Good.objects.count()
+        if missing > 0:
+            kind = Type.objects.first() or Type.objects.create(name="bench-type")
+            Good.objects.bulk_create(
+                Good(
+                    name=f"json-bench-{i}",
+                    amount=i % 50,
+                    cost=i * 1.5,
+                    type=kind,
+                    image="uploads/products/bench.jpg",
+                    max_voltage=i % 400,
+                )
+                for i in range(missing)
+            )
+
+    @staticmethod
+    def _goods(fields, rows):
+        queryset = Good.objects.order_by("id").values(*_good_columns(fields))[:rows]
+        return {"goods": [_serialize_row(row, fields) for row in queryset]}
+
+    @staticmethod
+    def _measure(encode, data, repeat):
+        encoded = encode(data)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            encode(data)
+        return (time.perf_counter() - started) / repeat, len(encoded)
@@ -0,0 +1,97 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from shop.filters import GoodFilter
+from shop.models import Good, Type
+from shop.services.bitmap import get_catalog_index, invalidate_catalog
+
+VOLTAGES = [6, 10, 16, 25, 35, 50, 63, 100, 250, 400]
+CAPACITIES = [1, 10, 22, 47, 100, 220, 470, 1000, 2200, 4700]
+RESISTANCES = [10, 100, 220, 470, 1000, 2200, 4700, 10000, 47000, 100000]
+
+
+class Command(BaseCommand):
+    help = "Benchmark parametric range search on a synthetic catalog; all rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--batch", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            types = self._seed(options["rows"], options["batch"])
+            cases = [
+                ("100uF capacitors above 25V", {
+                    "type": types["Capacitor"], "capacity_min": 100, "capacity_max": 100, "max_voltage_min": 26,
+                }),
+                ("1k-10k resistors", {
+                    "type": types["Resistor"], "resistance_min": 1000, "resistance_max": 10000,
+                }),
+                ("any type, 400V, cost under 5", {
+                    "max_voltage_min": 400, "cost_max": 5,
+                }),
+            ]
+
+            started = time.perf_counter()
+            invalidate_catalog()
+            index = get_catalog_index()
+            self.stdout.write(f"bitmap build: {time.perf_counter() - started:.2f}s for {options['rows']} rows")
+
+            for label, params in cases:
+                params = {key: str(value) for key, value in params.items()}
+                with override_settings(CATALOG_BITMAP_INDEX=False):
+                    heuristic = self._time(options["repeat"], lambda: self._db_page(params))
+                planned = self._time(options["repeat"], lambda: self._db_page(params))
+                goodFilter = GoodFilter(params, queryset=Good.objects.all())
+                goodFilter.is_valid()
+                filters = goodFilter.index_filters()
+                bitmap = self._time(options["repeat"], lambda: index.count(filters))
+                self.stdout.write(
+                    f"{label}: matches={index.count(filters)} "
+                    f"db(heuristic)={heuristic * 1000:.1f}ms "
+                    f"db(planned)={planned * 1000:.1f}ms "
+                    f"bitmap={bitmap * 1000:.3f}ms"
+                )
+            transaction.set_rollback(True)
+        invalidate_catalog()
+
+    def _seed(self, rows, batch):
+        rng = random.Random(42)
+        types = {name: Type.objects.get_or_create(name=name)[0].pk for name in ("Capacitor", "Resistor")}
+        pending = []
+        for i in range(rows):
+            is_capacitor = i % 2 == 0
+            pending.append(Good(
+                name=f"bench-{i}",
+                amount=rng.randint(0, 500),
+                cost=round(rng.uniform(0.1, 100), 2),
+                type_id=types["Capacitor"] if is_capacitor else types["Resistor"],
+                max_voltage=rng.choice(VOLTAGES),
+                capacity=rng.choice(CAPACITIES) if is_capacitor else None,
+                resistance=None if is_capacitor else rng.choice(RESISTANCES),
+            ))
+            if len(pending) == batch:
+                Good.objects.bulk_create(pending)
+                pending = []
+        Good.objects.bulk_create(pending)
+        return types
+
+    @staticmethod
+    def _db_page(params):
+        goodFilter = GoodFilter(params, queryset=Good.objects.order_by("id"))
+        return goodFilter.qs.count(), list(goodFilter.qs.values_list("id", flat=True)[:48])
+
+    @staticmethod
+    def _time(repeat, func):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Good, StockSlot
+from shop.services.stock import fold_stock, shard_stock, sharding_enabled, unshard_stock
+
+
+class Command(BaseCommand):
+    help = "Split hot goods' stock across StockSlot rows, merge it back, or fold slot sums into Good.amount."
+
+    def add_arguments(self, parser):
+        parser.add_argument("good_ids", nargs="*", type=int)
+        parser.add_argument("--slots", type=int, default=8)
+        parser.add_argument("--unshard", action="store_true")
+        parser.add_argument("--fold", action="store_true", help="only fold slot sums into Good.amount")
+
+    def handle(self, *args, **options):
+        if options["fold"]:
+            self.stdout.write(f"Folded {fold_stock(options['good_ids'] or None)} goods")
+            return
+        if not options["good_ids"]:
+            raise CommandError("Pass at least one good id")
+        if not sharding_enabled() and not options["unshard"]:
+            raise CommandError("Enable SHARDED_STOCK first; checkout ignores slots while it is off")
+        if options["slots"] < 1:
+            raise CommandError("--slots must be at least 1")
+        for good in Good.objects.filter(id__in=options["good_ids"]):
+            if options["unshard"]:
+                unshard_stock(good)
+                self.stdout.write(f"{good.name}: unsharded")
+            else:
+                shard_stock(good, options["slots"])
+                self.stdout.write(f"{good.name}: {StockSlot.objects.filter(good=good).count()} slots")
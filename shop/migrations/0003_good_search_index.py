@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS shop_good_name_tsv ON shop_good "
+            "USING gin (to_tsvector('simple'::regconfig, COALESCE((name)::text, ''::text)))"
+        )
+        # Matches the UPPER(name::text) LIKE UPPER(...) that icontains compiles to
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS shop_good_name_trgm ON shop_good "
+            "USING gin (UPPER((name)::text) gin_trgm_ops)"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS shop_good_fts USING fts5(name, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            "INSERT INTO shop_good_fts(rowid, name) SELECT id, name FROM shop_good"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS shop_good_name_tsv")
+        schema_editor.execute("DROP INDEX IF EXISTS shop_good_name_trgm")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS shop_good_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
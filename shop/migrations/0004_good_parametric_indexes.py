@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0002_initial'),
+        ('shop', '0003_good_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(fields=['type', 'max_voltage'], name='shop_good_type_voltage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(fields=['type', 'capacity'], name='shop_good_type_capacity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(fields=['type', 'resistance'], name='shop_good_type_resist_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_good_parametric_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='Slot')),
+                ('amount', models.IntegerField(default=0, verbose_name='Amount')),
+                ('good', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_slots', to='shop.good', verbose_name='Good')),
+            ],
+            options={
+                'verbose_name': 'Stock slot',
+                'verbose_name_plural': 'Stock slots',
+                'constraints': [models.UniqueConstraint(fields=('good', 'slot'), name='shop_stockslot_good_slot'), models.CheckConstraint(condition=models.Q(('amount__gte', 0)), name='Slot_amount_must_be_greater_or_equal_0', violation_error_message='check_slot_amount')],
+            },
+        ),
+    ]
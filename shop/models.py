@@ -67,6 +67,12 @@ class Good(models.Model):
     class Meta:
         verbose_name = "Good"
         verbose_name_plural = "Goods"
+        indexes = [
+            # Parametric search: equality on type, range on the characteristic
+            models.Index(fields=["type", "max_voltage"], name="shop_good_type_voltage_idx"),
+            models.Index(fields=["type", "capacity"], name="shop_good_type_capacity_idx"),
+            models.Index(fields=["type", "resistance"], name="shop_good_type_resist_idx"),
+        ]
         constraints = [
             models.CheckConstraint(condition = models.Q(cost__gte = 0), name="Cost_must_be_greater_or_equal_0", violation_error_message="check_cost"),
             models.CheckConstraint(condition = models.Q(amount__gte = 0), name="Amount_must_be_greater_or_equal_0", violation_error_message="check_amount")
@@ -80,7 +86,29 @@ class Good(models.Model):
     
     def num_of_favorites(self):
         return UserFavorites.objects.filter(good=self).count()
+
+    def stock_amount(self):
+        #Summed stock slots while the good is sharded, otherwise amount
+        from shop.services.stock import stock_amount
+        return stock_amount(self)
     
+class StockSlot(models.Model):
+    #Optional shard of Good.amount for flash-sale goods, see shop.services.stock
+    good = models.ForeignKey(Good, null=False, blank=False, verbose_name="Good", on_delete=models.CASCADE, related_name="stock_slots")
+    slot = models.PositiveSmallIntegerField(null=False, verbose_name="Slot")
+    amount = models.IntegerField(null=False, default=0, verbose_name="Amount")
+
+    def __str__(self):
+        return f"{self.good_id}#{self.slot}: {self.amount}"
+
+    class Meta:
+        verbose_name = "Stock slot"
+        verbose_name_plural = "Stock slots"
+        constraints = [
+            models.UniqueConstraint(fields=["good", "slot"], name="shop_stockslot_good_slot"),
+            models.CheckConstraint(condition = models.Q(amount__gte = 0), name="Slot_amount_must_be_greater_or_equal_0", violation_error_message="check_slot_amount")
+        ]
+
 class Rate(models.Model):
     good = models.ForeignKey(Good, null=True, blank=False, verbose_name="Good", on_delete=models.CASCADE)
     user = models.ForeignKey('users.User', null=True, blank=False, verbose_name="User", on_delete=models.CASCADE)
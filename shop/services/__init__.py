@@ -0,0 +1,10 @@
+from .catalog import catalog_cards
+from .pagination import InvalidCursor, KeysetPage, akeyset_paginate, keyset_paginate
+
+__all__ = [
+    "catalog_cards",
+    "InvalidCursor",
+    "KeysetPage",
+    "akeyset_paginate",
+    "keyset_paginate",
+]
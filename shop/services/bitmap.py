@@ -0,0 +1,334 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Count
+
+from shop.models import Good
+from .versions import bump_version, get_version
+
+FACET_FIELDS = ("type", "company", "tag")
+RANGE_FIELDS = ("cost", "max_voltage", "capacity", "resistance")
+VERSION_KEY = "shop:catalog:version"
+# Range fields with at most this many distinct values also get a bitset per value
+VALUE_MASK_LIMIT = 256
+
+
+def _mask_from_ids(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for good_id in ids:
+        buffer[good_id >> 3] |= 1 << (good_id & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def ids_from_mask(mask):
+    ids = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            ids.append(index * 8 + low.bit_length() - 1)
+            byte ^= low
+    return ids
+
+
+def catalog_version():
+    return get_version(VERSION_KEY)
+
+
+def invalidate_catalog():
+    #This process rebuilds its index on next access, the others within CACHE_VERSION_TTL
+    return bump_version(VERSION_KEY)
+
+
+class CatalogIndex:
+    #Per-process bitsets (bit n = Good id n) for equality facets, sorted arrays for ranges
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.all = 0
+        self.facets = {}
+        self.ranges = {}
+        self.value_masks = {}
+        self.rows = {}
+
+    def build(self, version):
+        rows = {}
+        for good_id, type_id, company_id, *values in Good.objects.values_list(
+            "id", "type_id", "company_id", *RANGE_FIELDS
+        ):
+            rows[good_id] = {
+                "type": type_id,
+                "company": company_id,
+                "tag": set(),
+                **dict(zip(RANGE_FIELDS, values)),
+            }
+        for good_id, tag_id in Good.tag.through.objects.values_list("good_id", "tag_id"):
+            if good_id in rows:
+                rows[good_id]["tag"].add(tag_id)
+
+        facet_ids = {field: {} for field in FACET_FIELDS}
+        ranges = {field: [] for field in RANGE_FIELDS}
+        for good_id, row in rows.items():
+            for field in FACET_FIELDS:
+                for value in self._facet_values(row, field):
+                    facet_ids[field].setdefault(value, []).append(good_id)
+            for field in RANGE_FIELDS:
+                if row[field] is not None:
+                    ranges[field].append((row[field], good_id))
+        value_masks = {}
+        for field, pairs in ranges.items():
+            pairs.sort()
+            value_ids = {}
+            for value, good_id in pairs:
+                value_ids.setdefault(value, []).append(good_id)
+            value_masks[field] = None
+            if len(value_ids) <= VALUE_MASK_LIMIT:
+                value_masks[field] = (
+                    sorted(value_ids),
+                    {value: _mask_from_ids(ids) for value, ids in value_ids.items()},
+                )
+
+        with self.lock:
+            self.rows = rows
+            self.all = _mask_from_ids(rows)
+            self.facets = {
+                field: {value: _mask_from_ids(ids) for value, ids in values.items()}
+                for field, values in facet_ids.items()
+            }
+            self.ranges = ranges
+            self.value_masks = value_masks
+            self.version = version
+
+    @staticmethod
+    def _facet_values(row, field):
+        if field == "tag":
+            return row["tag"]
+        return [row[field]] if row[field] is not None else []
+
+    def remove(self, good_id):
+        with self.lock:
+            row = self.rows.pop(good_id, None)
+            if row is None:
+                return
+            bit = 1 << good_id
+            self.all &= ~bit
+            for field in FACET_FIELDS:
+                for value in self._facet_values(row, field):
+                    self.facets[field][value] &= ~bit
+            for field in RANGE_FIELDS:
+                if row[field] is not None:
+                    pairs = self.ranges[field]
+                    position = bisect_left(pairs, (row[field], good_id))
+                    if position < len(pairs) and pairs[position] == (row[field], good_id):
+                        del pairs[position]
+                    if self.value_masks.get(field):
+                        self.value_masks[field][1][row[field]] &= ~bit
+
+    def add(self, good_id, row):
+        with self.lock:
+            self.remove(good_id)
+            self.rows[good_id] = row
+            bit = 1 << good_id
+            self.all |= bit
+            for field in FACET_FIELDS:
+                for value in self._facet_values(row, field):
+                    self.facets[field][value] = self.facets[field].get(value, 0) | bit
+            for field in RANGE_FIELDS:
+                if row[field] is not None:
+                    insort(self.ranges[field], (row[field], good_id))
+                    if self.value_masks.get(field):
+                        keys, masks = self.value_masks[field]
+                        if row[field] not in masks:
+                            insort(keys, row[field])
+                        masks[row[field]] = masks.get(row[field], 0) | bit
+
+    def _bitset_backed(self, field):
+        return field in FACET_FIELDS or bool(self.value_masks.get(field))
+
+    def _range_mask(self, field, low, high):
+        if self.value_masks.get(field):
+            keys, masks = self.value_masks[field]
+            start = 0 if low is None else bisect_left(keys, low)
+            end = len(keys) if high is None else bisect_right(keys, high)
+            mask = 0
+            for value in keys[start:end]:
+                mask |= masks[value]
+            return mask
+        pairs = self.ranges[field]
+        start = 0 if low is None else bisect_left(pairs, (low, -1))
+        end = len(pairs) if high is None else bisect_right(pairs, (high, float("inf")))
+        return _mask_from_ids(good_id for _, good_id in pairs[start:end])
+
+    def _filter_candidates(self, mask, field, low, high):
+        kept = []
+        for good_id in ids_from_mask(mask):
+            value = self.rows[good_id][field]
+            if value is None:
+                continue
+            if (low is None or value >= low) and (high is None or value <= high):
+                kept.append(good_id)
+        return _mask_from_ids(kept)
+
+    def _range_span(self, field, low, high):
+        pairs = self.ranges[field]
+        start = 0 if low is None else bisect_left(pairs, (low, -1))
+        end = len(pairs) if high is None else bisect_right(pairs, (high, float("inf")))
+        return max(end - start, 0)
+
+    def _facet_mask(self, field, value):
+        if isinstance(value, (list, tuple, set)):
+            mask = 0
+            for item in value:
+                mask |= self.facets[field].get(item, 0)
+            return mask
+        return self.facets[field].get(value, 0)
+
+    def estimate(self, filters):
+        #Cardinality per predicate: popcount for facets, bisect span for ranges
+        estimates = {}
+        with self.lock:
+            for field, value in _active_predicates(filters):
+                if field in FACET_FIELDS:
+                    estimates[field] = self._facet_mask(field, value).bit_count()
+                else:
+                    estimates[field] = self._range_span(field, *value)
+        return estimates
+
+    def match(self, filters, skip=None, base=None):
+        with self.lock:
+            mask = self.all if base is None else self.all & base
+            estimates = self.estimate(filters)
+            # Bitset-backed predicates are near free, so they go first (most
+            # selective first); sliced ranges then pay O(min(span, survivors))
+            order = sorted(estimates, key=lambda f: (not self._bitset_backed(f), estimates[f]))
+            for field in order:
+                if field == skip:
+                    continue
+                if field in FACET_FIELDS:
+                    mask &= self._facet_mask(field, filters[field])
+                elif not self._bitset_backed(field) and mask.bit_count() < estimates[field]:
+                    # Fewer survivors than range hits: test the survivors' values
+                    mask = self._filter_candidates(mask, field, *filters[field])
+                else:
+                    mask &= self._range_mask(field, *filters[field])
+                if not mask:
+                    break
+            return mask
+
+    def count(self, filters, base=None):
+        return self.match(filters, base=base).bit_count()
+
+    def facet_counts(self, filters, base=None):
+        #Each facet is counted with its own selection lifted so siblings stay visible
+        counts = {}
+        with self.lock:
+            for field in FACET_FIELDS:
+                mask = self.match(filters, skip=field, base=base)
+                counts[field] = {
+                    value: (mask & bits).bit_count()
+                    for value, bits in self.facets[field].items()
+                }
+        return counts
+
+
+def _active_predicates(filters):
+    for field in FACET_FIELDS:
+        if filters.get(field) not in (None, []):
+            yield field, filters[field]
+    for field in RANGE_FIELDS:
+        bounds = filters.get(field)
+        if bounds and (bounds[0] is not None or bounds[1] is not None):
+            yield field, bounds
+
+
+_index = CatalogIndex()
+
+
+def bitmap_enabled():
+    return getattr(settings, "CATALOG_BITMAP_INDEX", True)
+
+
+def get_catalog_index():
+    version = catalog_version()
+    if _index.version != version:
+        with _index.lock:
+            if _index.version != version:
+                _index.build(version)
+    return _index
+
+
+def _good_row(good_id):
+    values = (
+        Good.objects.filter(id=good_id)
+        .values("type_id", "company_id", *RANGE_FIELDS)
+        .first()
+    )
+    if values is None:
+        return None
+    return {
+        "type": values["type_id"],
+        "company": values["company_id"],
+        "tag": set(Good.tag.through.objects.filter(good_id=good_id).values_list("tag_id", flat=True)),
+        **{field: values[field] for field in RANGE_FIELDS},
+    }
+
+
+def _apply_change(good_id):
+    previous = _index.version
+    version = invalidate_catalog()
+    if previous is None or version != previous + 1:
+        # The stamp moved elsewhere or expired; a full rebuild happens lazily
+        return
+    with _index.lock:
+        row = _good_row(good_id)
+        if row is None:
+            _index.remove(good_id)
+        else:
+            _index.add(good_id, row)
+        _index.version = version
+
+
+def good_changed(good_id):
+    transaction.on_commit(lambda: _apply_change(good_id))
+
+
+def catalog_changed():
+    transaction.on_commit(invalidate_catalog)
+
+
+def _db_facet_counts(queryset_for):
+    counts = {}
+    for field in FACET_FIELDS:
+        rows = (
+            queryset_for(field)
+            .order_by()
+            .values(field)
+            .annotate(total=Count("id", distinct=True))
+        )
+        counts[field] = {row[field]: row["total"] for row in rows if row[field] is not None}
+    return counts
+
+
+def facet_counts(filters, base_ids=None, queryset_for=None):
+    """Facet counts for the sidebar.
+
+    `queryset_for(field)` must return the filtered queryset with that facet's
+    own predicate removed; it is only used when the bitmap index is off or
+    cannot be built.
+    """
+    if bitmap_enabled():
+        try:
+            index = get_catalog_index()
+        except DatabaseError:
+            index = None
+        if index is not None:
+            base = None if base_ids is None else _mask_from_ids(base_ids)
+            return index.facet_counts(filters, base=base)
+    if queryset_for is None:
+        return {}
+    return _db_facet_counts(queryset_for)
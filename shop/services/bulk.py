@@ -0,0 +1,117 @@
+from django.db import IntegrityError, transaction
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from shop.models import Good
+from .bitmap import catalog_changed
+from .search import reindex_goods
+
+BULK_MAX_ROWS = 5000
+BULK_BATCH_SIZE = 500
+# Retries when another request inserts the same new name mid-upsert
+UPSERT_ATTEMPTS = 3
+INTEGER_FIELDS = ("amount", "max_voltage", "capacity", "resistance")
+NULLABLE_FIELDS = ("max_voltage", "capacity", "resistance")
+UPSERT_FIELDS = ("amount", "cost") + NULLABLE_FIELDS
+
+
+class BulkValidationError(ValueError):
+    pass
+
+
+def _clean_record(record):
+    if not isinstance(record, dict):
+        raise BulkValidationError("Record must be an object")
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise BulkValidationError("Name is required")
+    cleaned = {"name": name.strip()}
+    for field in UPSERT_FIELDS:
+        if field not in record:
+            continue
+        value = record[field]
+        if value is None and field in NULLABLE_FIELDS:
+            cleaned[field] = None
+            continue
+        try:
+            value = int(value) if field in INTEGER_FIELDS else float(value)
+        except (TypeError, ValueError):
+            raise BulkValidationError(f"Invalid {field}")
+        if field in ("amount", "cost") and value < 0:
+            raise BulkValidationError(f"{field} must be greater or equal 0")
+        cleaned[field] = value
+    return cleaned
+
+
+def _write_goods(valid):
+    #One pass over the rows under lock: {index: (status, good)}
+    existing = {
+        good.name: good
+        for good in Good.objects.select_for_update().filter(name__in=list(valid))
+    }
+    written, to_create, to_update, changed_fields = {}, [], [], set()
+    for name, (index, cleaned) in valid.items():
+        good = existing.get(name)
+        if good is None:
+            good = Good(**cleaned)
+            to_create.append(good)
+            written[index] = ("created", good)
+            continue
+        changed = [
+            field for field, value in cleaned.items()
+            if field != "name" and getattr(good, field) != value
+        ]
+        if not changed:
+            #Same values as stored: no UPDATE, no history row, no new ETag
+            written[index] = ("unchanged", good)
+            continue
+        for field in changed:
+            setattr(good, field, cleaned[field])
+        changed_fields.update(changed)
+        to_update.append(good)
+        written[index] = ("updated", good)
+
+    if to_create:
+        bulk_create_with_history(to_create, Good, batch_size=BULK_BATCH_SIZE)
+    if to_update:
+        bulk_update_with_history(to_update, Good, sorted(changed_fields), batch_size=BULK_BATCH_SIZE)
+    if to_create:
+        reindex_goods(to_create)
+    if to_create or to_update:
+        catalog_changed()
+    return written
+
+
+def upsert_goods(records):
+    """Insert or update goods by name in one transaction.
+
+    Returns one result dict per input record, in order. Invalid records are
+    reported and skipped; records matching the stored row are reported as
+    unchanged and not written; the rest are written with bulk_create/bulk_update
+    and their history rows in bulk.
+    """
+    results = [None] * len(records)
+    valid = {}
+    for index, record in enumerate(records):
+        try:
+            cleaned = _clean_record(record)
+        except BulkValidationError as exc:
+            results[index] = {"index": index, "status": "error", "error": str(exc)}
+            continue
+        if cleaned["name"] in valid:
+            results[index] = {"index": index, "status": "error", "error": "Duplicate name in request"}
+            continue
+        valid[cleaned["name"]] = (index, cleaned)
+
+    for attempt in range(UPSERT_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                written = _write_goods(valid)
+            break
+        except IntegrityError:
+            #A concurrent request created one of the new names first; look them up again
+            if attempt == UPSERT_ATTEMPTS - 1:
+                raise
+
+    for index, (status, good) in written.items():
+        results[index] = {"index": index, "status": status, "id": good.pk, "name": good.name}
+    return results
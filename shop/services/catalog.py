@@ -0,0 +1,27 @@
+from django.db.models import Prefetch
+from shop.models import Good, Tag
+
+# Columns a catalog card needs; everything else on Good stays deferred
+CARD_FIELDS = (
+    "id",
+    "name",
+    "amount",
+    "cost",
+    "image",
+    "type__name",
+    "company__name",
+)
+
+
+def catalog_cards(queryset=None):
+    #Listing read path: type/company are joined, tags come in one extra query
+    if queryset is None:
+        queryset = Good.objects.all()
+    return (
+        queryset
+        .select_related("type", "company")
+        .only(*CARD_FIELDS)
+        .prefetch_related(
+            Prefetch("tag", queryset=Tag.objects.only("id", "name").order_by("name"))
+        )
+    )
@@ -0,0 +1,163 @@
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.views.decorators.http import condition
+
+from cart.models import Order, OrderItem
+from shop.models import Company, Good, Type
+from shop.services.stock import sharded_stock
+from shopBoom.responses import JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPES, wants_msgpack
+
+
+def _history_table(model):
+    return model.history.model._meta.db_table
+
+
+def history_state(*sources):
+    """Newest history_date and a row version across several history tables in one round trip.
+
+    Each source is a model or a (model, column, value) triple restricting
+    that table, e.g. (Good, "id", 5). The version folds in the newest
+    history_id and the row count: a transaction that commits late can carry
+    an older history_date than rows already served, but it still adds a row.
+    """
+    parts, params = [], []
+    for source in sources:
+        model, column, value = source if isinstance(source, tuple) else (source, None, None)
+        sql = (
+            "SELECT MAX(history_date) AS changed, MAX(history_id) AS last_id, COUNT(*) AS row_count"
+            f" FROM {_history_table(model)}"
+        )
+        if column:
+            sql += f" WHERE {column} = %s"
+            params.append(value)
+        parts.append(sql)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT MAX(changed), SUM(last_id), SUM(row_count)"
+            f" FROM ({' UNION ALL '.join(parts)}) AS latest",
+            params,
+        )
+        changed, last_id, row_count = cursor.fetchone()
+    if isinstance(changed, str):
+        # SQLite hands back text for aggregates over datetime columns
+        changed = connection.ops.convert_datetimefield_value(changed, None, connection)
+    return changed, f"{last_id or 0}.{row_count or 0}"
+
+
+def _etag(prefix, state, request, stock=None):
+    changed, version = state
+    stamp = int(changed.timestamp() * 1_000_000) if changed else 0
+    #JSON and MessagePack bodies of the same data are different representations
+    content_type = MSGPACK_CONTENT_TYPES[0] if wants_msgpack(request) else JSON_CONTENT_TYPE
+    variant = f"{content_type}?{request.GET.urlencode()}#{stock}"
+    query = hashlib.sha1(variant.encode("utf-8")).hexdigest()[:12]
+    return f'"{prefix}-{stamp}.{version}-{query}"'
+
+
+def _safe(request):
+    return request.method in ("GET", "HEAD")
+
+
+def _sharded_stock(request):
+    #Slot sales and folds write no history row, so the served slot sums are part of
+    #the ETag; they carry no timestamp, so those responses get no Last-Modified
+    if not hasattr(request, "_sharded_stock"):
+        request._sharded_stock = sharded_stock()
+    return request._sharded_stock
+
+
+def _goods_state(request):
+    if not hasattr(request, "_goods_state"):
+        request._goods_state = history_state(Good, Type, Company)
+    return request._goods_state
+
+
+def goods_last_modified(request, *args, **kwargs):
+    if not _safe(request) or _sharded_stock(request):
+        return None
+    return _goods_state(request)[0]
+
+
+def goods_etag(request, *args, **kwargs):
+    if not _safe(request):
+        return None
+    stock = sorted(_sharded_stock(request).items())
+    return _etag("goods", _goods_state(request), request, stock)
+
+
+def _good_state(request, pk):
+    #None for a missing good, so the view answers 404 rather than 304 on a stale tag
+    if not hasattr(request, "_good_state"):
+        request._good_state = None
+        if Good.objects.filter(pk=pk).exists():
+            request._good_state = history_state((Good, "id", pk), Type, Company)
+    return request._good_state
+
+
+def good_last_modified(request, pk, *args, **kwargs):
+    if not _safe(request) or pk in _sharded_stock(request):
+        return None
+    state = _good_state(request, pk)
+    return state[0] if state else None
+
+
+def good_etag(request, pk, *args, **kwargs):
+    if not _safe(request):
+        return None
+    state = _good_state(request, pk)
+    if state is None:
+        return None
+    return _etag(f"good-{pk}", state, request, _sharded_stock(request).get(pk))
+
+
+def _orders_state(request):
+    if not hasattr(request, "_orders_state"):
+        request._orders_state = history_state(
+            (Order, "user_id", request.user.pk),
+            (OrderItem, "user_id", request.user.pk),
+            Good,
+        )
+    return request._orders_state
+
+
+def orders_last_modified(request, *args, **kwargs):
+    if not _safe(request) or not request.user.is_authenticated:
+        return None
+    return _orders_state(request)[0]
+
+
+def orders_etag(request, *args, **kwargs):
+    if not _safe(request) or not request.user.is_authenticated:
+        return None
+    return _etag(f"orders-{request.user.pk}", _orders_state(request), request)
+
+
+def conditional_view(etag_func=None, last_modified_func=None):
+    """condition() that is safe around async views.
+
+    Django calls the callables synchronously even for coroutine views, so
+    resolve them in a worker thread first; they memoize on the request and
+    the second (synchronous) call is free.
+    """
+    def decorator(view_func):
+        wrapped = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+        if not iscoroutinefunction(view_func):
+            return wrapped
+
+        def _resolve(request, *args, **kwargs):
+            for func in (last_modified_func, etag_func):
+                if func:
+                    func(request, *args, **kwargs)
+
+        @wraps(view_func)
+        async def _wrapped(request, *args, **kwargs):
+            await sync_to_async(_resolve)(request, *args, **kwargs)
+            return await wrapped(request, *args, **kwargs)
+
+        return _wrapped
+
+    return decorator
@@ -0,0 +1,21 @@
+from django.utils import timezone
+
+from shop.models import Good
+
+
+def record_goods_history(goods, history_type, reason=""):
+    #For write paths that bypass save()/delete() (raw SQL, bulk updates)
+    goods = list(goods)
+    if not goods:
+        return
+    historical = Good.history.model
+    now = timezone.now()
+    historical.objects.bulk_create([
+        historical(
+            history_date=now,
+            history_type=history_type,
+            history_change_reason=reason,
+            **{field.attname: getattr(good, field.attname) for field in historical.tracked_fields},
+        )
+        for good in goods
+    ])
@@ -0,0 +1,174 @@
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+# Sort key -> ordering; the trailing id makes every ordering a unique key
+SORT_ORDERINGS = {
+    "id": ("id",),
+    "-id": ("-id",),
+    "cost": ("cost", "id"),
+    "-cost": ("-cost", "-id"),
+    "name": ("name", "id"),
+}
+DEFAULT_SORT = "id"
+CURSOR_PARAMS = ("after", "before")
+APPROX_COUNT_CAP = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, total=None, total_is_exact=True):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_is_exact = total_is_exact
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _field_name(ordering):
+    return ordering.lstrip("-")
+
+
+def encode_cursor(sort, obj, sorts=SORT_ORDERINGS):
+    values = [_cursor_value(obj, _field_name(field)) for field in sorts[sort]]
+    #default=str keeps dates as ISO strings, which the seek filter accepts back
+    raw = json.dumps([sort] + values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _cursor_value(obj, field):
+    if isinstance(obj, dict):
+        return obj[field]
+    return getattr(obj, field)
+
+
+def decode_cursor(sort, token, sorts=SORT_ORDERINGS):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(payload, list) or not payload or payload[0] != sort:
+        raise InvalidCursor("Cursor does not match the requested sort")
+    values = payload[1:]
+    if len(values) != len(sorts[sort]):
+        raise InvalidCursor("Malformed cursor")
+    return values
+
+
+def _clean_values(model, orderings, values):
+    #A tampered cursor must fail as InvalidCursor, not as a ValidationError/TypeError later
+    cleaned = []
+    for ordering, value in zip(orderings, values):
+        if value is None or isinstance(value, (list, dict, bool)):
+            raise InvalidCursor("Malformed cursor")
+        try:
+            cleaned.append(model._meta.get_field(_field_name(ordering)).to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor("Malformed cursor")
+    return cleaned
+
+
+def _seek_filter(orderings, values, forward):
+    #(a, b) > (x, y)  ==  a > x OR (a = x AND b > y), per column direction
+    condition = Q()
+    equal = {}
+    for ordering, value in zip(orderings, values):
+        field = _field_name(ordering)
+        ascending = not ordering.startswith("-")
+        lookup = "gt" if ascending == forward else "lt"
+        condition |= Q(**equal, **{f"{field}__{lookup}": value})
+        equal[field] = value
+    return condition
+
+
+def _reverse(orderings):
+    return [o[1:] if o.startswith("-") else f"-{o}" for o in orderings]
+
+
+def approximate_count(queryset, cap=APPROX_COUNT_CAP):
+    #Returns (count, is_exact); postgres answers from the planner estimate
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"]), False
+    count = queryset.values("pk")[:cap + 1].count()
+    if count > cap:
+        return cap, False
+    return count, True
+
+
+def _seek(queryset, limit, sort, after, before, sorts):
+    #Sliced queryset for the page plus one look-ahead row
+    if sort not in sorts:
+        raise InvalidCursor(f"Unsupported sort: {sort}")
+    orderings = sorts[sort]
+    if before:
+        values = _clean_values(queryset.model, orderings, decode_cursor(sort, before, sorts))
+        queryset = queryset.filter(_seek_filter(orderings, values, forward=False))
+        return queryset.order_by(*_reverse(orderings))[:limit + 1]
+    if after:
+        values = _clean_values(queryset.model, orderings, decode_cursor(sort, after, sorts))
+        queryset = queryset.filter(_seek_filter(orderings, values, forward=True))
+    return queryset.order_by(*orderings)[:limit + 1]
+
+
+def _page(rows, limit, sort, after, before, sorts, count=None, exact=True):
+    has_more = len(rows) > limit
+    if before:
+        items = rows[:limit][::-1]
+        previous_cursor = encode_cursor(sort, items[0], sorts) if has_more and items else None
+        next_cursor = encode_cursor(sort, items[-1], sorts) if items else None
+    else:
+        items = rows[:limit]
+        next_cursor = encode_cursor(sort, items[-1], sorts) if has_more else None
+        previous_cursor = encode_cursor(sort, items[0], sorts) if after and items else None
+    return KeysetPage(items, next_cursor, previous_cursor, total=count, total_is_exact=exact)
+
+
+def keyset_paginate(queryset, limit, sort=DEFAULT_SORT, after=None, before=None, total=None, sorts=SORT_ORDERINGS):
+    rows = list(_seek(queryset, limit, sort, after, before, sorts))
+    count, exact = None, True
+    if total == "exact":
+        count = queryset.order_by().count()
+    elif total == "approx":
+        count, exact = approximate_count(queryset)
+    return _page(rows, limit, sort, after, before, sorts, count, exact)
+
+
+async def akeyset_paginate(queryset, limit, sort=DEFAULT_SORT, after=None, before=None, total=None, sorts=SORT_ORDERINGS):
+    rows = [row async for row in _seek(queryset, limit, sort, after, before, sorts)]
+    count, exact = None, True
+    if total == "exact":
+        count = await queryset.order_by().acount()
+    elif total == "approx":
+        count, exact = await sync_to_async(approximate_count)(queryset)
+    return _page(rows, limit, sort, after, before, sorts, count, exact)
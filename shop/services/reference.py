@@ -0,0 +1,59 @@
+import threading
+
+from django.db import transaction
+
+from shop.models import Company, Tag, Type
+from .versions import bump_version, get_version
+
+VERSION_KEY = "shop:reference:version"
+REFERENCE_MODELS = {
+    "tag": Tag,
+    "type": Type,
+    "company": Company,
+}
+
+
+class ReferenceCache:
+    #Process-local {id: name} dicts for the small lookup tables
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.tables = {}
+
+    def get(self):
+        version = get_version(VERSION_KEY)
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.tables = {
+                        kind: dict(model.objects.order_by("id").values_list("id", "name"))
+                        for kind, model in REFERENCE_MODELS.items()
+                    }
+                    self.version = version
+        return self.tables
+
+
+_reference = ReferenceCache()
+
+
+def reference_names(kind):
+    return _reference.get()[kind]
+
+
+def reference_choices(kind):
+    return list(reference_names(kind).items())
+
+
+def reference_name(kind, pk):
+    try:
+        return reference_names(kind).get(int(pk))
+    except (TypeError, ValueError):
+        return None
+
+
+def invalidate_reference():
+    return bump_version(VERSION_KEY)
+
+
+def reference_changed():
+    transaction.on_commit(invalidate_reference)
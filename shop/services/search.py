@@ -0,0 +1,115 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from shop.models import Good
+
+SEARCH_CONFIG = "simple"
+FTS_TABLE = "shop_good_fts"
+# The FTS5 trigram tokenizer cannot match anything shorter than one trigram
+MIN_TRIGRAM_LENGTH = 3
+
+_fts_tables = {}
+
+
+def _sqlite_fts_ready(connection):
+    if connection.vendor != "sqlite":
+        return False
+    if connection.alias not in _fts_tables:
+        _fts_tables[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[connection.alias]
+
+
+def forget_fts_tables(using=None):
+    #Migrations can create or drop the shadow table under a running process
+    if using is None:
+        _fts_tables.clear()
+    else:
+        _fts_tables.pop(using, None)
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_goods(queryset, text):
+    #Ranked name search; callers get a `search_rank` annotation when indexes are used
+    text = (text or "").strip()
+    if not text:
+        return queryset
+    connection = connections[queryset.db]
+
+    if connection.vendor == "postgresql":
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        vector = SearchVector("name", config=SEARCH_CONFIG)
+        return (
+            queryset
+            .annotate(search_document=vector)
+            .filter(Q(search_document=query) | Q(name__icontains=text))
+            .annotate(search_rank=SearchRank(vector, query) + TrigramSimilarity("name", text))
+            .order_by("-search_rank", "id")
+        )
+
+    if _sqlite_fts_ready(connection) and len(text) >= MIN_TRIGRAM_LENGTH:
+        phrase = _fts_phrase(text)
+        meta = queryset.model._meta
+        pk = f"{connection.ops.quote_name(meta.db_table)}.{connection.ops.quote_name(meta.pk.column)}"
+        return (
+            queryset
+            .filter(id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                [phrase],
+            ))
+            .annotate(search_rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {pk}",
+                [phrase],
+                output_field=FloatField(),
+            ))
+            .order_by("-search_rank", "id")
+        )
+
+    return queryset.filter(name__icontains=text)
+
+
+def index_good(good, using="default"):
+    connection = connections[using]
+    if not _sqlite_fts_ready(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [good.pk])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (%s, %s)", [good.pk, good.name])
+
+
+def reindex_goods(goods, using="default"):
+    #Bulk writes skip post_save, so callers resync the shadow table themselves
+    connection = connections[using]
+    if not _sqlite_fts_ready(connection):
+        return
+    rows = [(good.pk, good.name) for good in goods]
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk, _ in rows])
+        cursor.executemany(f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (%s, %s)", rows)
+
+
+def unindex_good(good_id, using="default"):
+    connection = connections[using]
+    if not _sqlite_fts_ready(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [good_id])
+
+
+def rebuild_search_index(using="default"):
+    connection = connections[using]
+    if not _sqlite_fts_ready(connection):
+        return
+    quote = connection.ops.quote_name
+    meta = Good._meta
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name) "
+            f"SELECT {quote(meta.pk.column)}, {quote(meta.get_field('name').column)} FROM {quote(meta.db_table)}"
+        )
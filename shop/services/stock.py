@@ -0,0 +1,189 @@
+import random
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+
+from shop.models import Good, StockSlot
+
+SHARDED_STOCK_KEY = "shop:stock:sharded"
+
+
+class InsufficientStock(ValueError):
+    pass
+
+
+def sharding_enabled():
+    return getattr(settings, "SHARDED_STOCK", False)
+
+
+def _spread(total, slots):
+    #Even split; the remainder goes to randomly chosen slots
+    base, extra = divmod(total, slots)
+    shares = [base + 1] * extra + [base] * (slots - extra)
+    random.shuffle(shares)
+    return shares
+
+
+def sharded_good_ids(good_ids):
+    if not sharding_enabled():
+        return set()
+    return set(
+        StockSlot.objects.filter(good_id__in=good_ids).values_list("good_id", flat=True).distinct()
+    )
+
+
+def shard_stock(good, slots):
+    """Move good.amount into `slots` StockSlot rows (re-sharding folds first)."""
+    with transaction.atomic():
+        fold_stock([good.pk])
+        good = Good.objects.select_for_update().get(pk=good.pk)
+        StockSlot.objects.filter(good=good).delete()
+        StockSlot.objects.bulk_create(
+            StockSlot(good=good, slot=slot, amount=share)
+            for slot, share in enumerate(_spread(good.amount, slots))
+        )
+    invalidate_stock()
+
+
+def unshard_stock(good):
+    with transaction.atomic():
+        fold_stock([good.pk])
+        StockSlot.objects.filter(good=good).delete()
+    invalidate_stock()
+
+
+def sharded_stock():
+    """{good_id: summed slot amount} for every sharded good.
+
+    Cached for STOCK_SLOT_CACHE_SECONDS rather than invalidated per
+    checkout; invalidating on every sale would recreate the hot spot.
+    """
+    if not sharding_enabled():
+        return {}
+    stock = cache.get(SHARDED_STOCK_KEY)
+    if stock is None:
+        stock = dict(
+            StockSlot.objects.values("good_id").annotate(total=Sum("amount")).values_list("good_id", "total")
+        )
+        cache.set(SHARDED_STOCK_KEY, stock, getattr(settings, "STOCK_SLOT_CACHE_SECONDS", 2))
+    return stock
+
+
+def stock_amount(good):
+    return sharded_stock().get(good.pk, good.amount)
+
+
+def invalidate_stock():
+    cache.delete(SHARDED_STOCK_KEY)
+
+
+def fold_stock(good_ids=None):
+    """Write slot totals back into Good.amount for sharded goods.
+
+    A no-op while SHARDED_STOCK is off: checkout then writes Good.amount
+    directly and leftover slots are stale.
+    """
+    if not sharding_enabled():
+        return 0
+    totals = (
+        StockSlot.objects.filter(good=OuterRef("pk"))
+        .values("good")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    goods = Good.objects.filter(id__in=StockSlot.objects.values("good_id"))
+    if good_ids is not None:
+        goods = goods.filter(id__in=good_ids)
+    updated = goods.update(amount=Subquery(totals))
+    invalidate_stock()
+    return updated
+
+
+def add_stock(good_id, delta):
+    """Spread a warehouse delta over the good's slots in one UPDATE.
+
+    Returns False when the good is not sharded, leaving the caller to
+    update Good.amount itself. Raises InsufficientStock when a negative
+    delta is larger than the slots hold; nothing is changed then.
+    """
+    if not sharding_enabled():
+        return False
+    slots = list(StockSlot.objects.filter(good_id=good_id).values_list("slot", flat=True))
+    if not slots:
+        return False
+    with transaction.atomic():
+        if delta < 0:
+            if not _take_from_slots(good_id, -delta):
+                raise InsufficientStock(f"Not enough stock to remove {-delta}")
+        else:
+            StockSlot.objects.filter(good_id=good_id).update(
+                amount=F("amount") + Case(
+                    *(When(slot=slot, then=Value(share)) for slot, share in zip(slots, _spread(delta, len(slots)))),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+        fold_stock([good_id])
+    return True
+
+
+def _take_from_slots(good_id, amount):
+    #A random slot that can cover the whole amount; buyers rarely meet on one row
+    candidates = list(
+        StockSlot.objects.filter(good_id=good_id, amount__gte=amount).values_list("slot", flat=True)
+    )
+    random.shuffle(candidates)
+    for slot in candidates:
+        taken = StockSlot.objects.filter(good_id=good_id, slot=slot, amount__gte=amount).update(
+            amount=F("amount") - amount
+        )
+        if taken:
+            return True
+    #No single slot is big enough: drain several under lock
+    rows = list(
+        StockSlot.objects.select_for_update().filter(good_id=good_id, amount__gt=0).order_by("-amount")
+    )
+    if sum(row.amount for row in rows) < amount:
+        return False
+    remaining, touched = amount, []
+    for row in rows:
+        take = min(row.amount, remaining)
+        row.amount -= take
+        remaining -= take
+        touched.append(row)
+        if not remaining:
+            break
+    StockSlot.objects.bulk_update(touched, ["amount"])
+    return True
+
+
+def decrement_stock(deltas, sharded=None):
+    """Take {good_id: amount} off stock; must run inside a transaction.
+
+    Plain goods are updated in one UPDATE ... CASE statement that only
+    touches rows still holding enough stock, so the return value (True
+    when every good was covered) doubles as the check. Sharded goods take
+    their amount from a random stock slot instead of the Good row.
+    """
+    if not deltas:
+        return True
+    if sharded is None:
+        sharded = sharded_good_ids(list(deltas))
+    for good_id in sharded:
+        if not _take_from_slots(good_id, deltas[good_id]):
+            return False
+    plain = {good_id: amount for good_id, amount in deltas.items() if good_id not in sharded}
+    if not plain:
+        return True
+    condition = reduce(or_, (Q(id=good_id, amount__gte=amount) for good_id, amount in plain.items()))
+    updated = Good.objects.filter(condition).update(
+        amount=Case(
+            *(When(id=good_id, then=F("amount") - amount) for good_id, amount in plain.items()),
+            output_field=IntegerField(),
+        )
+    )
+    return updated == len(plain)
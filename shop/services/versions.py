@@ -0,0 +1,32 @@
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _version_ttl():
+    return getattr(settings, "CACHE_VERSION_TTL", 60)
+
+
+def _new_stamp():
+    #Random, so a stamp re-created after expiry never matches a copy built against the old one
+    return random.getrandbits(48)
+
+
+def get_version(key):
+    return cache.get_or_set(key, _new_stamp, timeout=_version_ttl())
+
+
+def bump_version(key):
+    """Move the stamp so local copies built against it reload on next access.
+
+    With the default per-process cache only this process sees the bump; the
+    stamp expires after CACHE_VERSION_TTL, so other processes (workers, admin,
+    management commands) reload within that bound. A shared CACHES backend
+    makes the bump visible everywhere at once.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _new_stamp(), timeout=_version_ttl())
+        return cache.incr(key)
@@ -0,0 +1,53 @@
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import Company, Good, Tag, Type
+from .services.bitmap import catalog_changed, good_changed
+from .services.reference import reference_changed
+from .services.search import forget_fts_tables, index_good, unindex_good
+
+
+@receiver(post_save, sender=Good)
+def sync_good_search_index(sender, instance, using, **kwargs):
+    index_good(instance, using=using)
+
+
+@receiver(post_delete, sender=Good)
+def drop_good_search_index(sender, instance, using, **kwargs):
+    unindex_good(instance.pk, using=using)
+
+
+@receiver(post_migrate)
+def reset_search_table_cache(sender, using, **kwargs):
+    forget_fts_tables(using)
+
+
+@receiver(post_save, sender=Good)
+@receiver(post_delete, sender=Good)
+def sync_good_catalog_index(sender, instance, **kwargs):
+    good_changed(instance.pk)
+
+
+@receiver(m2m_changed, sender=Good.tag.through)
+def sync_good_tags_catalog_index(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        good_changed(instance.pk)
+        return
+    # Tag-side changes; post_clear has no pk_set, so rebuild from scratch
+    if pk_set is None:
+        catalog_changed()
+        return
+    for good_id in pk_set:
+        good_changed(good_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Type)
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Type)
+@receiver(post_delete, sender=Company)
+def sync_reference_cache(sender, **kwargs):
+    reference_changed()
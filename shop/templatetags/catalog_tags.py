@@ -0,0 +1,14 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def facet_count(counts, value):
+    #Radio/checkbox values arrive as ModelChoiceIteratorValue or strings
+    if not counts or value in (None, ""):
+        return ""
+    try:
+        return counts.get(int(str(value)), 0)
+    except (TypeError, ValueError):
+        return ""
@@ -1,14 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.db import connection, transaction
 from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator
 from django.http import QueryDict
-from .models import Good, Type, Tag, Company, Rate
+from .models import Good, Rate
 from users.models import User, UserFavorites
 from users.decorators import role_required
+from users.services import clear_filters, current_filters, remember_filters
 from .forms import *
 from django.http import HttpResponse
 from shop.filters import GoodFilter
+from shop.services import catalog_cards, keyset_paginate, InvalidCursor
+from shop.services.pagination import CURSOR_PARAMS, SORT_ORDERINGS, DEFAULT_SORT
+from shop.services.bitmap import catalog_changed
+from shop.services.reference import REFERENCE_MODELS, reference_name
+from shop.services.history import record_goods_history
+from shop.services.stock import InsufficientStock, add_stock
 
 
 def _humanize_filter_label(key):
@@ -18,24 +26,50 @@ def _humanize_filter_label(key):
 def _resolve_filter_value(key, value):
     if not value:
         return "Any"
-    model_map = {
-        "type": Type,
-        "company": Company,
-        "tag": Tag,
-    }
-    model = model_map.get(key)
-    if model:
-        try:
-            return model.objects.get(id=value).name
-        except model.DoesNotExist:
-            return value
+    if isinstance(value, list):
+        return ", ".join(str(_resolve_filter_value(key, item)) for item in value)
+    if key in REFERENCE_MODELS:
+        return reference_name(key, value) or value
     return value
 
+def _keyset_page(request, queryset, page_size):
+    sort = request.GET.get("sort") or DEFAULT_SORT
+    if sort not in SORT_ORDERINGS:
+        sort = DEFAULT_SORT
+    try:
+        return keyset_paginate(
+            queryset,
+            page_size,
+            sort=sort,
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+            total="approx",
+        )
+    except InvalidCursor:
+        return keyset_paginate(queryset, page_size, sort=sort, total="approx")
+
+
+def _keyset_links(request, page_obj):
+    links = {}
+    for name, param, cursor in (
+        ("next", "after", page_obj.next_cursor),
+        ("previous", "before", page_obj.previous_cursor),
+    ):
+        if not cursor:
+            continue
+        query = request.GET.copy()
+        for key in CURSOR_PARAMS + ("page",):
+            query.pop(key, None)
+        query["pagination"] = "keyset"
+        query[param] = cursor
+        links[name] = query.urlencode()
+    return links
+
+
 def home(request):
     users = User.objects.all()
-    types = Type.objects.all()
     preference = getattr(request.user, "preference", None)
-    saved_filters = preference.saved_filters if preference and preference.saved_filters else {}
+    saved_filters = current_filters(request, preference) if preference else {}
 
     saved_filter_summary = [
         {"label": _humanize_filter_label(key), "value": _resolve_filter_value(key, value)}
@@ -47,33 +81,43 @@ def home(request):
     if not request.GET and saved_filters:
         query = QueryDict(mutable=True)
         for key, value in saved_filters.items():
-            query[key] = value
+            if isinstance(value, list):
+                query.setlist(key, value)
+            else:
+                query[key] = value
         filter_source = query
 
-    goodFilter = GoodFilter(filter_source, queryset=Good.objects.all().order_by("id"))
+    goodFilter = GoodFilter(filter_source, queryset=catalog_cards().order_by("id"))
     page_size = preference.page_size if preference else 12
-    paginator = Paginator(goodFilter.qs, page_size)
-    page_number = request.GET.get("page") or 1
-    page_obj = paginator.get_page(page_number)
+    keyset_mode = request.GET.get("pagination") == "keyset" or any(
+        request.GET.get(param) for param in CURSOR_PARAMS
+    )
+    keyset_links = {}
+    if keyset_mode:
+        page_obj = _keyset_page(request, goodFilter.qs, page_size)
+        keyset_links = _keyset_links(request, page_obj)
+    else:
+        paginator = Paginator(goodFilter.qs, page_size)
+        page_number = request.GET.get("page") or 1
+        page_obj = paginator.get_page(page_number)
 
-    if request.GET and preference:
-        preference.saved_filters = request.GET.dict()
-        preference.save(update_fields=["saved_filters"])
+    if request.GET and preference and not request.GET.get("clear"):
+        remember_filters(request, preference, request.GET)
 
     context = {
         "GoodsPage": page_obj,
         "Users": users,
-        "Types": types,
         "Form": goodFilter.form,
         "page_obj": page_obj,
         "saved_filter_summary": saved_filter_summary,
+        "keyset_mode": keyset_mode,
+        "keyset_links": keyset_links,
+        "facet_counts": goodFilter.facet_counts(),
     }
     
     if request.GET.get("clear"):
-        preference = getattr(request.user, "preference", None)
         if preference:
-            preference.saved_filters = {}
-            preference.save(update_fields=["saved_filters"])
+            clear_filters(request, preference)
         return redirect("home")
     
     return render(request, "main/home_page.html", context)
@@ -128,6 +172,7 @@ def _add_good_cost_sql(good_id):
     if connection.vendor == "postgresql":
         try:
             _execute_sql("CALL add_good_cost(%s)", [good_id])
+            catalog_changed()
             return
         except Exception:
             pass
@@ -135,6 +180,7 @@ def _add_good_cost_sql(good_id):
         "UPDATE shop_good SET cost = cost + cost * 0.10 WHERE id = %s",
         [good_id],
     )
+    catalog_changed()
 
 
 def _add_good_stock_sql(good_id, good_add):
@@ -154,6 +200,7 @@ def _delete_bad_goods_sql(rate):
     if connection.vendor == "postgresql":
         try:
             _execute_sql("CALL delete_bad_goods(%s)", [rate])
+            catalog_changed()
             return
         except Exception:
             pass
@@ -161,11 +208,12 @@ def _delete_bad_goods_sql(rate):
         "DELETE FROM shop_good WHERE id IN (SELECT good_id FROM shop_rate WHERE rating = %s)",
         [rate],
     )
+    catalog_changed()
 
 
 @role_required("warehouse", "admin")
 def warehouse_dashboard(request):
-    goods = Good.objects.all()
+    goods = catalog_cards().order_by("id")
     context = {
         "Goods": goods,
     }
@@ -179,6 +227,7 @@ def warehouse_add_cost(request):
     if good_id:
         with transaction.atomic():
             _add_good_cost_sql(good_id)
+            record_goods_history(Good.objects.filter(id=good_id), "~", "add_good_cost")
     return redirect("warehouse_dashboard")
 
 
@@ -191,8 +240,14 @@ def warehouse_add_stock(request):
     except (TypeError, ValueError):
         good_add = 0
     if good_id and good_add != 0:
-        with transaction.atomic():
-            _add_good_stock_sql(good_id, good_add)
+        try:
+            with transaction.atomic():
+                #Sharded goods spread the delta over their slots and fold the sum back
+                if not add_stock(good_id, good_add):
+                    _add_good_stock_sql(good_id, good_add)
+                record_goods_history(Good.objects.filter(id=good_id), "~", "add_good_stock")
+        except InsufficientStock as exc:
+            messages.error(request, str(exc))
     return redirect("warehouse_dashboard")
 
 
@@ -205,7 +260,9 @@ def warehouse_delete_bad_goods(request):
         rate = None
     if rate is not None:
         with transaction.atomic():
+            doomed = list(Good.objects.filter(id__in=Rate.objects.filter(rating=rate).values("good_id")))
             _delete_bad_goods_sql(rate)
+            record_goods_history(doomed, "-", "delete_bad_goods")
     return redirect("warehouse_dashboard")
 
 
@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopBoom.settings')
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+
+class ShopASGIHandler(ASGIHandler):
+    #Async views only pay off here; under WSGI their streaming bodies would be buffered
+    async def get_response_async(self, request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+application = ShopASGIHandler()
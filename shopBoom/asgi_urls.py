@@ -0,0 +1,15 @@
+from django.urls import path
+
+from analytics.views import AsyncGoodsChartData, AsyncOrdersChartData
+from shop import api
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+#Same names as the WSGI routes; listed first so they win
+urlpatterns = [
+    path('api/goods/', api.agoods_api, name="api_goods"),
+    path('api/goods/<int:pk>/', api.agood_detail_api, name="api_good_detail"),
+    path('api/orders/', api.aorders_api, name="api_orders"),
+    path('analytics/charts/goods/', AsyncGoodsChartData.as_view(), name="analytics_goods_chart"),
+    path('analytics/charts/orders/', AsyncOrdersChartData.as_view(), name="analytics_orders_chart"),
+] + wsgi_urlpatterns
@@ -0,0 +1,100 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import Promise
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def _default(obj):
+    #Anything the encoders do not know natively; mirrors DjangoJSONEncoder
+    if isinstance(obj, Model):
+        return obj.pk
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, Promise):
+        return str(obj)
+    #Subclasses (ErrorDict/ErrorList, SafeString) are handed back as plain types
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return list(obj)
+    if isinstance(obj, str):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class _FallbackEncoder(DjangoJSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Model):
+            return obj.pk
+        return super().default(obj)
+
+
+def dumps(data):
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            data,
+            default=_default,
+            option=orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(data, cls=_FallbackEncoder).encode("utf-8")
+
+
+def packb(data):
+    if not MSGPACK_AVAILABLE:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(data, default=_default, datetime=False)
+
+
+class FastJsonResponse(HttpResponse):
+    #Drop-in for JsonResponse(data, status=..., safe=...)
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault("content_type", JSON_CONTENT_TYPE)
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class MsgPackResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", MSGPACK_CONTENT_TYPES[0])
+        super().__init__(content=packb(data), **kwargs)
+
+
+def wants_msgpack(request):
+    if not MSGPACK_AVAILABLE:
+        return False
+    return request.get_preferred_type((JSON_CONTENT_TYPE,) + MSGPACK_CONTENT_TYPES) in MSGPACK_CONTENT_TYPES
+
+
+def negotiated_response(request, data, **kwargs):
+    #MessagePack only when the client prefers it; */* and no Accept get JSON
+    if wants_msgpack(request):
+        response = MsgPackResponse(data, **kwargs)
+    else:
+        response = FastJsonResponse(data, **kwargs)
+    patch_vary_headers(response, ("Accept",))
+    return response
@@ -52,6 +52,8 @@ MIDDLEWARE = [
     ]
 
 ROOT_URLCONF = 'shopBoom.urls'
+#Used by shopBoom.asgi only: routes the read-only API and charts to their async views
+ASGI_URLCONF = 'shopBoom.asgi_urls'
 
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static")
@@ -70,6 +72,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'users.context_processors.user_preferences',
+                'users.context_processors.user_roles',
                 
             ],
         },  
@@ -151,12 +154,58 @@ STATICFILES_DIR  = [
 ]
 
 CART_SESSION_ID = 'cart'
+# "db" keeps signed-in users' carts in cart.CartItem rows instead of the session
+CART_BACKEND = "session"
+
+# Per-process bitmap index for catalog filters and facet counts
+CATALOG_BITMAP_INDEX = True
+
+# Write-behind for UserPreference.saved_filters: flush after N staged users or T seconds
+# (a background timer enforces T; SIGTERM and interpreter exit flush what is left)
+SAVED_FILTERS_FLUSH_BATCH = 50
+SAVED_FILTERS_FLUSH_INTERVAL = 5.0
+
+# Checkout reserves stock with a conditional UPDATE instead of locking the goods rows
+CHECKOUT_LOCK_FREE_STOCK = False
+
+# Split hot goods' stock across StockSlot rows (manage.py shard_stock); reads see a cached sum
+SHARDED_STOCK = False
+STOCK_SLOT_CACHE_SECONDS = 2
+# CACHES is the per-process default, so a version stamp bump (reference lists,
+# catalog bitmap index) only reaches other processes when the stamp expires
+CACHE_VERSION_TTL = 60
+
+# Group commit: checkouts arriving within the window share one transaction
+CHECKOUT_GROUP_COMMIT = False
+CHECKOUT_BATCH_WINDOW_MS = 5
+CHECKOUT_BATCH_MAX = 50
+
+# Duplicates of an in-flight Idempotency-Key wait this long before getting 409
+IDEMPOTENCY_WAIT_SECONDS = 30
+# An unfinished claim is taken over only after this long; keep it several times
+# the worker request timeout so a slow checkout is never run twice
+IDEMPOTENCY_LEASE_SECONDS = 300
+# Keys older than this are treated as unused and deleted (manage.py purge_idempotency_keys);
+# clients must not retry with the same key after it
+IDEMPOTENCY_TTL = 24 * 60 * 60
 
 LOGIN_URL = "/login"
 
 AUTH_USER_MODEL = "users.User"
+# RoleModelBackend loads user.role with the session user; ModelBackend keeps sessions created before it valid
+AUTHENTICATION_BACKENDS = [
+    "users.backends.RoleModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
 EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "ShopBoom <no-reply@shopboom.local>")
+
+# Order emails go through cart.OutboxEmail; manage.py send_outbox delivers them
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE_SECONDS = 30
+OUTBOX_RETRY_MAX_SECONDS = 3600
+OUTBOX_POLL_SECONDS = 2
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
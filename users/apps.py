@@ -1,6 +1,16 @@
+import threading
+
 from django.apps import AppConfig
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .services.preferences import install_sigterm_flush
+
+        #signal.signal() only works from the main thread
+        if threading.current_thread() is threading.main_thread():
+            install_sigterm_flush()
@@ -1,5 +1,12 @@
+from users.services.roles import request_roles
+
+
 def user_preferences(request):
     if not request.user.is_authenticated:
         return {"user_preference": None}
     preference = getattr(request.user, "preference", None)
     return {"user_preference": preference}
+
+
+def user_roles(request):
+    return {"user_roles": request_roles(request)}
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
-from .models import User, Role, UserPreference, UserCredenetials
+from .models import User, UserPreference, UserCredenetials
+from .services.roles import customer_role_id
 
 
 class LoginForm(AuthenticationForm):
@@ -31,8 +32,7 @@ class RegistrationForm(forms.ModelForm):
         user = super().save(commit=False)
         user.set_password(self.cleaned_data["password"])
 
-        role = Role.objects.get(rolename="CUSTOMER")
-        user.role = role
+        user.role_id = customer_role_id()
 
         if commit:
             user.save()
@@ -1,7 +1,7 @@
 import os
 from django.contrib.auth import get_user_model
 from users.models import Role
-from prometheus_client import Gauge, Counter, CollectorRegistry, multiprocess
+from prometheus_client import Gauge, Counter, Histogram, CollectorRegistry, multiprocess
 
 PROM_DIR = os.path.join(os.getcwd(), 'metrics_data')
 os.makedirs(PROM_DIR, exist_ok=True)
@@ -18,6 +18,22 @@ avg_bonus_gauge = Gauge('app_average_bonus', 'Средний бонус поль
 # Auth counter
 login_counter = Counter('app_logins_total', 'Количество выполненных логинов', registry=registry)
 
+# Saved filters write-behind
+saved_filters_writes_avoided_counter = Counter('app_saved_filters_writes_avoided_total', 'Запросы без изменения сохранённых фильтров', registry=registry)
+saved_filters_flushed_counter = Counter('app_saved_filters_flushed_total', 'Сохранённые фильтры, записанные пакетом', registry=registry)
+# Order email outbox
+outbox_pending_gauge = Gauge('app_outbox_pending', 'Письма в очереди outbox', registry=registry, multiprocess_mode='max')
+outbox_oldest_pending_gauge = Gauge('app_outbox_oldest_pending_seconds', 'Возраст самого старого неотправленного письма', registry=registry, multiprocess_mode='max')
+outbox_sent_counter = Counter('app_outbox_sent_total', 'Отправленные письма из outbox', registry=registry)
+outbox_retry_counter = Counter('app_outbox_retries_total', 'Неудачные попытки отправки, отложенные на повтор', registry=registry)
+outbox_failed_counter = Counter('app_outbox_failed_total', 'Письма, не отправленные после всех попыток', registry=registry)
+outbox_latency_histogram = Histogram(
+    'app_outbox_delivery_seconds',
+    'Время от постановки письма в очередь до отправки',
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 300, 1800, 3600),
+    registry=registry,
+)
+
 def update_metrics():
     User = get_user_model()
     total_users_gauge.set(User.objects.count())
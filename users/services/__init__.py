@@ -1,5 +1,23 @@
 from .auth_service import AuthService
+from .preferences import (
+    clear_filters,
+    current_filters,
+    forget_session_filters,
+    remember_filters,
+    saved_filters_buffer,
+)
+from .roles import arequest_roles, customer_role_id, normalize_role, request_roles, user_roles
 
 __all__ = [
-    "AuthService"
-]
\ No newline at end of file
+    "AuthService",
+    "arequest_roles",
+    "customer_role_id",
+    "normalize_role",
+    "request_roles",
+    "user_roles",
+    "clear_filters",
+    "current_filters",
+    "forget_session_filters",
+    "remember_filters",
+    "saved_filters_buffer",
+]
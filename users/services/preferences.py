@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from simple_history.utils import bulk_update_with_history
+
+from users.metrics import saved_filters_flushed_counter, saved_filters_writes_avoided_counter
+from users.models import UserPreference
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "saved_filters"
+# Query params that move through results rather than describe a filter
+NAVIGATION_PARAMS = {"page", "after", "before", "pagination", "sort", "clear", "csrfmiddlewaretoken"}
+
+
+def normalize_filters(params):
+    #Accepts a QueryDict (multi-valued keys such as tag become lists) or a dict
+    items = params.lists() if hasattr(params, "lists") else params.items()
+    filters = {}
+    for key, value in sorted(items):
+        if key in NAVIGATION_PARAMS:
+            continue
+        if isinstance(value, list):
+            value = [item for item in value if item not in (None, "")]
+            if len(value) == 1:
+                value = value[0]
+        if value not in (None, "", []):
+            filters[key] = value
+    return filters
+
+
+class SavedFiltersBuffer:
+    #Write-behind for UserPreference.saved_filters: latest value per preference, flushed in batches
+    def __init__(self, batch_size, interval):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.first_staged = None
+        self.timer = None
+
+    def _schedule(self):
+        #Caller holds the lock; the timer enforces the interval when no further stage() arrives
+        if self.timer is None:
+            self.timer = threading.Timer(self.interval, self._flush_in_background)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            #Timer threads get their own connection; don't leak it
+            connection.close()
+
+    def stage(self, preference_pk, filters):
+        with self.lock:
+            self.pending[preference_pk] = filters
+            if self.first_staged is None:
+                self.first_staged = time.monotonic()
+            self._schedule()
+            due = (
+                len(self.pending) >= self.batch_size
+                or time.monotonic() - self.first_staged >= self.interval
+            )
+        if due:
+            self.flush()
+
+    def discard(self, preference_pk):
+        with self.lock:
+            self.pending.pop(preference_pk, None)
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            self.first_staged = None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not batch:
+            return 0
+        try:
+            preferences = list(UserPreference.objects.filter(pk__in=batch))
+            for preference in preferences:
+                preference.saved_filters = batch[preference.pk]
+            bulk_update_with_history(
+                preferences,
+                UserPreference,
+                ["saved_filters"],
+                batch_size=self.batch_size,
+            )
+        except DatabaseError:
+            logger.exception("Saved filters flush failed; keeping %d entries", len(batch))
+            with self.lock:
+                for pk, filters in batch.items():
+                    self.pending.setdefault(pk, filters)
+                if self.first_staged is None:
+                    self.first_staged = time.monotonic()
+                self._schedule()
+            return 0
+        saved_filters_flushed_counter.inc(len(preferences))
+        return len(preferences)
+
+
+saved_filters_buffer = SavedFiltersBuffer(
+    batch_size=getattr(settings, "SAVED_FILTERS_FLUSH_BATCH", 50),
+    interval=getattr(settings, "SAVED_FILTERS_FLUSH_INTERVAL", 5.0),
+)
+atexit.register(saved_filters_buffer.flush)
+
+
+def install_sigterm_flush():
+    #atexit does not run when the process dies from SIGTERM; flush first, then defer to the previous handler
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        saved_filters_buffer.flush()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+def current_filters(request, preference):
+    #The session holds the newest value; the row may lag until the next flush
+    if SESSION_KEY in request.session:
+        return request.session[SESSION_KEY]
+    if preference and preference.saved_filters:
+        return preference.saved_filters
+    return {}
+
+
+def remember_filters(request, preference, params):
+    filters = normalize_filters(params)
+    if filters == current_filters(request, preference):
+        saved_filters_writes_avoided_counter.inc()
+        return filters
+    request.session[SESSION_KEY] = filters
+    saved_filters_buffer.stage(preference.pk, filters)
+    return filters
+
+
+def clear_filters(request, preference):
+    saved_filters_buffer.discard(preference.pk)
+    request.session[SESSION_KEY] = {}
+    preference.saved_filters = {}
+    preference.save(update_fields=["saved_filters"])
+
+
+def forget_session_filters(request, preference):
+    #After a direct edit of the row (settings page) the row is authoritative again
+    saved_filters_buffer.discard(preference.pk)
+    request.session.pop(SESSION_KEY, None)
@@ -0,0 +1,63 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from users.models import Role
+
+ROLE_ALIASES = {
+    "admin": {"admin", "administrator", "админ", "администратор"},
+    "warehouse": {"warehouse", "storekeeper", "кладовщик", "складчик"},
+    "customer": {"customer", "user", "пользователь", "клиент"},
+}
+# alias -> canonical role, so normalizing is one dict lookup
+ROLE_LOOKUP = {alias: role for role, aliases in ROLE_ALIASES.items() for alias in aliases}
+
+CUSTOMER_ROLE = "CUSTOMER"
+CUSTOMER_ROLE_CACHE_KEY = "users:role:customer"
+
+
+def normalize_role(role_name):
+    if not role_name:
+        return ""
+    role_name = role_name.strip().lower()
+    return ROLE_LOOKUP.get(role_name, role_name)
+
+
+def user_roles(user):
+    #Staff and superusers count as admins everywhere
+    if not user.is_authenticated:
+        return frozenset()
+    roles = set()
+    if user.role_id:
+        roles.add(normalize_role(user.role.rolename))
+    if user.is_staff or user.is_superuser:
+        roles.add("admin")
+    return frozenset(roles)
+
+
+def request_roles(request):
+    """Normalized roles of request.user, resolved once per request."""
+    roles = getattr(request, "_roles", None)
+    if roles is None:
+        roles = request._roles = user_roles(request.user)
+    return roles
+
+
+async def arequest_roles(request):
+    roles = getattr(request, "_roles", None)
+    if roles is None:
+        user = await request.auser()
+        #Sessions from the plain ModelBackend still load user.role lazily
+        roles = request._roles = await sync_to_async(user_roles)(user)
+    return roles
+
+
+def customer_role_id():
+    role_id = cache.get(CUSTOMER_ROLE_CACHE_KEY)
+    if role_id is None:
+        role_id = Role.objects.values_list("id", flat=True).get(rolename=CUSTOMER_ROLE)
+        cache.set(CUSTOMER_ROLE_CACHE_KEY, role_id, None)
+    return role_id
+
+
+def forget_customer_role():
+    cache.delete(CUSTOMER_ROLE_CACHE_KEY)
@@ -1,3 +1,132 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from users.backends import RoleModelBackend
+from users.models import Role, User, UserPreference
+from users.services import preferences
+from users.services.preferences import SavedFiltersBuffer, clear_filters, remember_filters
+from users.services.roles import customer_role_id, request_roles
+
+
+class RoleResolutionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.role = Role.objects.create(rolename=" Administrator ")
+        #bulk_create skips the user history signal
+        self.user = User.objects.bulk_create([User(username="boss", role=self.role)])[0]
+
+    def test_roles_resolve_once_per_request_from_the_session_user(self):
+        request = RequestFactory().get("/")
+        with self.assertNumQueries(1):
+            request.user = RoleModelBackend().get_user(self.user.pk)
+            self.assertEqual(request_roles(request), {"admin"})
+            self.assertEqual(request_roles(request), {"admin"})
+
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        self.assertEqual(request_roles(request), frozenset())
+
+    def test_customer_role_is_cached_until_roles_change(self):
+        customer = Role.objects.create(rolename="CUSTOMER")
+        with self.assertNumQueries(1):
+            self.assertEqual(customer_role_id(), customer.pk)
+            self.assertEqual(customer_role_id(), customer.pk)
+        customer.delete()
+        with self.assertRaises(Role.DoesNotExist):
+            customer_role_id()
+
+
+#The users app has no historical tables in its migrations
+@override_settings(SIMPLE_HISTORY_ENABLED=False)
+class SavedFiltersBufferTests(TestCase):
+    def setUp(self):
+        users = User.objects.bulk_create([User(username=f"user{i}") for i in range(3)])
+        self.preferences = UserPreference.objects.bulk_create([UserPreference(user=user) for user in users])
+        self.buffer = SavedFiltersBuffer(batch_size=3, interval=3600)
+        patcher = mock.patch.object(preferences, "saved_filters_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._cancel_timer)
+
+    def _cancel_timer(self):
+        if self.buffer.timer is not None:
+            self.buffer.timer.cancel()
+
+    def _request(self):
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        return request
+
+    def _saved(self):
+        return list(UserPreference.objects.order_by("pk").values_list("saved_filters", flat=True))
+
+    def test_staged_filters_are_written_in_one_batch_when_full(self):
+        first, second, third = self.preferences
+        self.buffer.stage(first.pk, {"q": "old"})
+        self.buffer.stage(first.pk, {"q": "tea"})
+        self.buffer.stage(second.pk, {"tag": ["1", "2"]})
+        self.assertEqual(self._saved(), [{}, {}, {}])
+
+        #One read of the batch, one UPDATE for all of it
+        with self.assertNumQueries(2):
+            self.buffer.stage(third.pk, {"company": "3"})
+        self.assertEqual(self._saved(), [{"q": "tea"}, {"tag": ["1", "2"]}, {"company": "3"}])
+        self.assertEqual(self.buffer.pending, {})
+
+    def test_unchanged_filters_are_not_staged(self):
+        preference = self.preferences[0]
+        preference.saved_filters = {"q": "tea"}
+        request = self._request()
+        with self.assertNumQueries(0):
+            remember_filters(request, preference, {"q": "tea", "page": "2"})
+        self.assertEqual(self.buffer.pending, {})
+        self.assertNotIn(preferences.SESSION_KEY, request.session)
+
+        remember_filters(request, preference, {"q": "coffee"})
+        self.assertEqual(self.buffer.pending, {preference.pk: {"q": "coffee"}})
+        self.assertEqual(request.session[preferences.SESSION_KEY], {"q": "coffee"})
+
+    def test_timer_flushes_an_idle_buffer(self):
+        buffer = SavedFiltersBuffer(batch_size=3, interval=0.01)
+        flushed = threading.Event()
+        with mock.patch.object(buffer, "flush", side_effect=lambda: flushed.set()):
+            buffer.stage(self.preferences[0].pk, {"q": "tea"})
+            #Nothing else is staged, the timer alone has to enforce the interval
+            self.assertTrue(flushed.wait(5))
+
+    def test_flush_cancels_the_timer(self):
+        self.buffer.stage(self.preferences[0].pk, {"q": "tea"})
+        timer = self.buffer.timer
+        self.assertTrue(timer.is_alive())
+        self.buffer.flush()
+        self.assertIsNone(self.buffer.timer)
+        timer.join(1)
+        self.assertFalse(timer.is_alive())
+
+    def test_sigterm_flushes_then_defers_to_previous_handler(self):
+        import signal
+
+        previous = mock.Mock()
+        original = signal.signal(signal.SIGTERM, previous)
+        self.addCleanup(signal.signal, signal.SIGTERM, original)
+        preferences.install_sigterm_flush()
+        self.buffer.stage(self.preferences[0].pk, {"q": "tea"})
+
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+        self.assertEqual(self._saved()[0], {"q": "tea"})
+        previous.assert_called_once_with(signal.SIGTERM, None)
+
+    def test_clear_drops_the_staged_value(self):
+        preference = self.preferences[0]
+        request = self._request()
+        remember_filters(request, preference, {"q": "tea"})
+        clear_filters(request, preference)
+        self.assertEqual(self.buffer.pending, {})
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(request.session[preferences.SESSION_KEY], {})
+        self.assertEqual(self._saved()[0], {})
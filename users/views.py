@@ -5,7 +5,7 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from .forms import LoginForm, RegistrationForm, UserSettingsForm, UserProfileForm, UserCredentialsForm
 from .metrics import login_counter, update_metrics
-from users.services import AuthService
+from users.services import AuthService, forget_session_filters, saved_filters_buffer
 from .models import UserPreference, UserCredenetials
 
 def login_user(request):
@@ -29,6 +29,7 @@ def registration_user(request):
     return render(request, 'auth/register.html', {'form': form})
 
 def logout_user(request):
+    saved_filters_buffer.flush()
     logout(request)
     return redirect('/')
 
@@ -54,6 +55,7 @@ def user_settings(request):
         elif form_type == "preferences":
             if preference_form.is_valid():
                 preference_form.save()
+                forget_session_filters(request, preference)
                 messages.success(request, "Preferences saved.")
                 return redirect("user_settings")
     else: